@@ -5,7 +5,7 @@ import os
 from pathlib import Path
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException, WebDriverException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import Select
@@ -18,12 +18,166 @@ import numpy as np
 import pandas as pd
 import json
 import csv
+import hashlib
+import itertools
+import queue
+import sqlite3
+import tempfile
+import threading
+from urllib.parse import urlparse
 from selenium.webdriver.common.action_chains import ActionChains
 from utils.web_driver import WebDriverManager
 from config.settings import Settings
 from document_type_detector import main as get_document_type
 class ElationBot:
 """Cross-platform RPA Bot for Elation EMR automation"""
+# Batch journal stages in the order a patient passes through them
+_JOURNAL_STAGES = ('searched', 'uploaded', 'verified')
+# Upload log record fields as (record key, CSV header)
+_UPLOAD_LOG_COLUMNS = (
+('timestamp', 'Timestamp'),
+('document_id', 'Document Id'),
+('patient', 'Patient'),
+('dob', 'DOB'),
+('file', 'File'),
+('physician', 'Physician'),
+('document_type', 'Document Type'),
+('title', 'Title'),
+('status', 'Status'),
+('remarks', 'Remarks'),
+('duration', 'Duration (s)')
+)
+_UPLOAD_LOG_SUFFIXES = {'csv': '.csv', 'jsonl': '.jsonl', 'sqlite': '.db'}
+# Returns the chart's file input (preferring one that accepts PDFs), made interactable for send_keys, else null
+_FILE_INPUT_SCRIPT = """
+var inputs = document.querySelectorAll("input[type='file']");
+if (!inputs.length) return null;
+var input = inputs[0];
+for (var i = 0; i < inputs.length; i++) {
+var accept = (inputs[i].getAttribute('accept') || '').toLowerCase();
+if (!accept || accept.indexOf('pdf') !== -1) { input = inputs[i]; break; }
+}
+input.removeAttribute('hidden');
+input.style.display = 'block';
+input.style.visibility = 'visible';
+input.style.opacity = 1;
+return input;
+"""
+# Returns [left, top, width, height] in device pixels for the viewport, or for the element matching arguments[0]
+_SCREEN_RECT_SCRIPT = """
+var ratio = window.devicePixelRatio || 1;
+var border = (window.outerWidth - window.innerWidth) / 2;
+var left = window.screenX + border;
+var top = window.screenY + window.outerHeight - window.innerHeight - border;
+var rect = {left: 0, top: 0, width: window.innerWidth, height: window.innerHeight};
+if (arguments[0]) {
+var element = document.querySelector(arguments[0]);
+if (!element) return null;
+rect = element.getBoundingClientRect();
+if (!rect.width || !rect.height) return null;
+}
+// Window and element rects are in CSS pixels, screenshots are in device pixels
+return [(left + rect.left) * ratio, (top + rect.top) * ratio, rect.width * ratio, rect.height * ratio];
+"""
+# Returns [index, element] for the first locator (in priority order) with a visible match, else null
+_RACE_SELECTORS_SCRIPT = """
+var locators = arguments[0], requireEnabled = arguments[1];
+for (var i = 0; i < locators.length; i++) {
+var nodes = [];
+try {
+if (locators[i][0] === 'xpath') {
+var snapshot = document.evaluate(locators[i][1], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var j = 0; j < snapshot.snapshotLength; j++) { nodes.push(snapshot.snapshotItem(j)); }
+} else {
+nodes = document.querySelectorAll(locators[i][1]);
+}
+} catch (e) {
+continue;
+}
+for (var k = 0; k < nodes.length; k++) {
+var node = nodes[k];
+if (node.nodeType !== 1) { continue; }
+var rect = node.getBoundingClientRect();
+var style = window.getComputedStyle(node);
+if (rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none'
+&& (!requireEnabled || !node.disabled)) {
+return [i, node];
+}
+}
+}
+return null;
+"""
+# Returns {entries, preview} for top-level chart feed items whose text or ids contain any needle
+_CHART_FEED_SCRIPT = """
+var root = document.querySelector(arguments[0]);
+if (!root) { return null; }
+var title = arguments[1], documentId = arguments[2], onlyNew = arguments[3];
+var itemSelector = 'li, article, [class*="feed-item" i], [class*="feeditem" i], [data-document-id], [data-id]';
+var candidates = root.querySelectorAll(itemSelector);
+var items = [];
+for (var i = 0; i < candidates.length; i++) {
+var parent = candidates[i].parentElement ? candidates[i].parentElement.closest(itemSelector) : null;
+if (!parent || parent === root || !root.contains(parent)) { items.push(candidates[i]); }
+}
+if (!items.length) { items = Array.prototype.slice.call(root.children); }
+var datePattern = /\\b\\d{1,2}\\/\\d{1,2}\\/\\d{2,4}\\b/;
+var normalize = function (value) { return (value || '').replace(/\\s+/g, ' ').trim().toLowerCase(); };
+var entries = [];
+for (var k = 0; k < items.length; k++) {
+var item = items[k];
+if (onlyNew && !(item.hasAttribute('data-rpa-new') || item.querySelector('[data-rpa-new]'))) { continue; }
+var text = (item.innerText || item.textContent || '').trim();
+var idElement = item.matches('[data-document-id], [data-id]') ? item : item.querySelector('[data-document-id], [data-id]');
+var itemDocumentId = idElement ? (idElement.getAttribute('data-document-id') || idElement.getAttribute('data-id') || '') : '';
+var titleElement = item.querySelector('[class*="title" i]');
+var matched = [];
+if (documentId) {
+// Whole whitespace-separated tokens only, so "17" never matches a date like 10/17/2025
+var tokens = text.toLowerCase().split(/\\s+/).map(function (token) { return token.replace(/^[()\\[\\],;:"']+|[()\\[\\],;:"'.]+$/g, ''); });
+if (normalize(itemDocumentId) === documentId || tokens.indexOf(documentId) !== -1 || tokens.indexOf(documentId + '.pdf') !== -1) { matched.push('document id'); }
+}
+if (title && titleElement && normalize(titleElement.innerText) === title) { matched.push('title'); }
+if (!title && !documentId && text.toLowerCase().indexOf('home health') !== -1) { matched.push('home health'); }
+if (!matched.length) { continue; }
+var lines = text.split('\\n').map(function (line) { return line.trim(); }).filter(Boolean);
+var dateMatch = text.match(datePattern);
+var typeElement = item.querySelector('[class*="type" i]');
+entries.push({
+date: dateMatch ? dateMatch[0] : '',
+type: typeElement ? typeElement.innerText.trim() : (lines[0] || ''),
+title: titleElement ? titleElement.innerText.trim() : (lines[1] || lines[0] || ''),
+document_id: itemDocumentId,
+matched: matched
+});
+}
+return {entries: entries, preview: (root.innerText || '').slice(0, 200)};
+"""
+# Marks elements added under the chart feed with data-rpa-new; observes the body so feed re-renders are caught
+_CHART_FEED_WATCH_SCRIPT = """
+var feedSelector = arguments[0];
+if (window.__rpaFeedObserver) { window.__rpaFeedObserver.disconnect(); }
+var marked = document.querySelectorAll('[data-rpa-new]');
+for (var i = 0; i < marked.length; i++) { marked[i].removeAttribute('data-rpa-new'); }
+window.__rpaFeedObserver = new MutationObserver(function (mutations) {
+mutations.forEach(function (mutation) {
+mutation.addedNodes.forEach(function (node) {
+if (node.nodeType === 1 && node.closest(feedSelector)) { node.setAttribute('data-rpa-new', '1'); }
+});
+});
+});
+window.__rpaFeedObserver.observe(document.body, {childList: true, subtree: true});
+return true;
+"""
+# Cheap login-state probe: current URL, visible search bar, 2FA input present, auth wording in visible text
+_AUTH_STATE_SCRIPT = """
+var searchBar = document.querySelector(arguments[0]);
+return {
+url: window.location.href,
+search_bar: !!(searchBar && searchBar.getClientRects().length),
+two_fa: !!document.querySelector(arguments[1]),
+auth_text: /2fa|authenticator|verification|verify|code|token/i.test(document.body ? document.body.innerText : '')
+};
+"""
 def __init__(self, headless=False):
 self.settings = Settings()
 self.web_driver_manager = WebDriverManager(
@@ -35,6 +189,61 @@ self.driver = None
 self.wait = None
 # Store the attributed to name from patient search
 self.attributed_to_name = None
+# Tab holding the chart being uploaded to when several charts are open
+self.chart_window_handle = None
+# Ceilings (seconds) for condition-based waits, overridable via configuration.WaitTimeouts
+self.wait_timeouts = {
+'page_ready': 10,
+'network_idle': 5,
+'navigation': 10,
+'new_tab': 5,
+'dialog_open': 15,
+'dialog_close': 15,
+'upload_confirm': 15,
+'session_probe': 5,
+'element': 10
+}
+# Start of the chart feed text from the last verification, for diagnostics
+self._chart_feed_preview = ''
+# Cache parsed config.json and OrderTemplate manifests between reads
+self._config_cache = None
+self._manifest_cache = {}
+# Saved cookies of the last authenticated session
+self.session_cookie_path = Path(__file__).parent.parent / '.session_cookies.json'
+# Upload audit log backend ('csv', 'jsonl' or 'sqlite'); flat-file rows are buffered and
+# parallel sessions write their own file and merge it at the end, SQLite is shared in WAL mode
+self.upload_log_backend = 'csv'
+self.upload_log_path = None
+self.upload_log_flush_rows = 20
+self._upload_log = None
+self._upload_log_buffer = []
+self._uploaded_document_ids = None
+# 'input' sends files straight to the chart's file input, 'manual' pauses for a drag and drop
+self.upload_mode = 'input'
+# Grayscale templates and their scaled variants, loaded once per file version
+self._templates = {}
+# Warm OCR engine (False once found unavailable), OCR results by region hash and
+# median word height per OCR purpose, used to downscale regions with large text
+self._ocr_engine = None
+self._ocr_cache = {}
+self._ocr_text_heights = {}
+# Flat float32 buffer reused for grayscale frames, grown to the largest capture seen
+self._frame_buffer = None
+# Screenshot pixels per pyautogui screen point (2.0 on Retina displays), measured on first capture
+self._screen_scale_factor = None
+# Last matched screen position, scale and confidence per template, checked before a global search
+self._template_hints = {}
+# Patient from the last search, recorded with each upload
+self.current_patient = None
+# Per-cascade selector hit/miss/latency statistics used to reorder selector lists
+self._selector_stats = None
+self._selector_stats_saved_at = 0
+# Persistent index of project directories used instead of recursive searches
+self._path_index = None
+self._path_index_dirty = False
+# Append-only batch journal of patient stages, open only while a batch runs
+self.batch_journal_path = Path(__file__).parent.parent / 'batch_journal.jsonl'
+self._batch_journal = None
 # Detect platform
 self.platform = platform.system().lower()
 self.is_windows = self.platform == 'windows'
@@ -49,7 +258,18 @@ self.logger = logging.getLogger(__name__)
 # Configure PyAutoGUI
 pyautogui.PAUSE = 0.1
 pyautogui.FAILSAFE = True
+self._apply_configuration()
 self.logger.info(f"ElationBot initialized for platform: {self.platform}")
+def _apply_configuration(self):
+"""Apply wait timeouts, upload mode and upload log settings from config.json"""
+try:
+configuration = self._load_config()['configuration']
+self.wait_timeouts.update(configuration.get('WaitTimeouts', {}))
+self.upload_log_backend = configuration.get('UploadLogBackend', self.upload_log_backend)
+self.upload_log_flush_rows = configuration.get('UploadLogFlushRows', self.upload_log_flush_rows)
+self.upload_mode = configuration.get('UploadMode', self.upload_mode)
+except (OSError, ValueError, KeyError):
+pass
 def initialize(self):
 """Initialize the bot"""
 try:
@@ -57,18 +277,26 @@ self.settings.validate_config()
 self.settings.ensure_directories()
 self.driver = self.web_driver_manager.get_driver()
 self.wait = WebDriverWait(self.driver, 10)
+self._apply_configuration()
 self.logger.info("Bot initialized successfully")
 return True
 except Exception as e:
 self.logger.error(f"Initialization failed: {str(e)}")
 return False
-def read_patient_data_from_excel(self, row_index=0):
-"""Read patient information from OrderTemplate.xlsx for a specific row, including Document Id and PDF path"""
-try:
-# Read config to get OrderTemplate path
+def _load_config(self):
+"""Load config.json once and reuse it until the file changes"""
 config_path = Path(__file__).parent.parent / 'config.json'
+config_mtime = config_path.stat().st_mtime
+if self._config_cache and self._config_cache[0] == config_mtime:
+return self._config_cache[1]
 with open(config_path, 'r') as f:
 config = json.load(f)
+self._config_cache = (config_mtime, config)
+return config
+def _resolve_order_template_path(self):
+"""Resolve the configured OrderTemplate.xlsx path relative to the project root"""
+# Read config to get OrderTemplate path
+config = self._load_config()
 order_template_path = config['configuration']['OrderTemplatePath']
 # Convert to absolute path from project root
 project_root = Path(__file__).parent.parent
@@ -103,209 +331,498 @@ if not order_template_path.exists():
 self.logger.error(f"OrderTemplate.xlsx not found at: {order_template_path}")
 # Try alternative search in project directory
 self.logger.info(f"Searching for OrderTemplate.xlsx in project directory: {project_root}")
-# Search for the file recursively
-xlsx_files = list(project_root.rglob('OrderTemplate.xlsx'))
-if xlsx_files:
-order_template_path = xlsx_files[0]
+# Search for the file through the persistent path index
+indexed_path = self._find_indexed_path('OrderTemplate.xlsx')
+if indexed_path:
+order_template_path = indexed_path
 self.logger.info(f"Found OrderTemplate.xlsx at: {order_template_path}")
 else:
 self.logger.error("OrderTemplate.xlsx not found anywhere in the project directory")
 return None
-# Read Excel file
-df = pd.read_excel(order_template_path)
-self.logger.info(f"Successfully read OrderTemplate.xlsx with {len(df)} rows")
-# Look for Patient Name and DOB columns (case insensitive)
+return order_template_path
+def _load_path_index(self):
+"""Load the on-disk index of directories and resolved file locations"""
+if self._path_index is None:
+index_path = Path(__file__).parent.parent / '.path_index.json'
+try:
+with open(index_path, 'r') as f:
+self._path_index = json.load(f)
+except (OSError, ValueError):
+self._path_index = {'names': [], 'dirs': {}, 'found': {}}
+return self._path_index
+def _write_json_atomic(self, path, data):
+"""Write JSON to a unique temporary file in the same directory and move it into place"""
+# Parallel sessions can save the same file at once, so each write gets its own temp file
+fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix='.tmp')
+try:
+with os.fdopen(fd, 'w') as f:
+json.dump(data, f)
+os.replace(temp_path, path)
+except BaseException:
+Path(temp_path).unlink(missing_ok=True)
+raise
+def _save_path_index(self):
+"""Persist the path index if it changed, replacing the previous file atomically"""
+if not self._path_index_dirty:
+return
+try:
+self._write_json_atomic(Path(__file__).parent.parent / '.path_index.json', self._path_index)
+self._path_index_dirty = False
+except Exception as e:
+self.logger.warning(f"Could not save path index: {str(e)}")
+def _scan_indexed_directory(self, directory, names):
+"""Return the index entry for a directory, listing it again only if its mtime changed"""
+index = self._load_path_index()
+key = str(directory)
+try:
+mtime = directory.stat().st_mtime
+except OSError:
+if index['dirs'].pop(key, None):
+self._path_index_dirty = True
+return None
+entry = index['dirs'].get(key)
+if entry and entry['mtime'] == mtime:
+return entry
+subdirs = []
+matches = []
+try:
+with os.scandir(directory) as entries:
+for dir_entry in entries:
+if dir_entry.name in names:
+matches.append(dir_entry.name)
+if dir_entry.is_dir(follow_symlinks=False) and not dir_entry.name.startswith('.'):
+subdirs.append(dir_entry.name)
+except OSError as e:
+self.logger.debug(f"Could not list {directory}: {str(e)}")
+return None
+previous = entry
+entry = {'mtime': mtime, 'subdirs': sorted(subdirs), 'matches': matches}
+index['dirs'][key] = entry
+# Saving the index itself touches the project root, so a new mtime alone isn't worth a save
+if not previous or previous['subdirs'] != entry['subdirs'] or sorted(previous['matches']) != sorted(matches):
+self._path_index_dirty = True
+return entry
+def _find_indexed_path(self, name):
+"""Find a file or folder by name under the project root using the persistent path index"""
+index = self._load_path_index()
+# A previously resolved location is reused as long as it still exists
+cached_path = index['found'].get(name)
+if cached_path and Path(cached_path).exists():
+return Path(cached_path)
+project_root = Path(__file__).parent.parent
+if name not in index['names']:
+# Directory entries only record tracked names, so they must be listed again
+index['names'].append(name)
+index['dirs'] = {}
+self._path_index_dirty = True
+names = set(index['names'])
+found_path = None
+pending = [project_root]
+# Breadth-first so shallower matches win, as with the old recursive search
+while pending and not found_path:
+next_level = []
+for directory in pending:
+entry = self._scan_indexed_directory(directory, names)
+if not entry:
+continue
+if name in entry['matches']:
+found_path = directory / name
+break
+next_level.extend(directory / subdir for subdir in entry['subdirs'])
+pending = next_level
+# Unchanged directories are only stat'ed, not listed, so a repeated miss reads no directory contents
+if found_path:
+if index['found'].get(name) != str(found_path):
+index['found'][name] = str(found_path)
+self._path_index_dirty = True
+elif name in index['found']:
+index['found'].pop(name)
+self._path_index_dirty = True
+self._save_path_index()
+return found_path
+def _get_signed_orders_dir(self):
+"""Get the SignedOrders folder, locating it through the path index if it has moved"""
+signed_orders_dir = Path(__file__).parent.parent / "files" / "SignedOrders"
+if not signed_orders_dir.is_dir():
+signed_orders_dir = self._find_indexed_path('SignedOrders') or signed_orders_dir
+return signed_orders_dir.resolve()
+def _detect_manifest_columns(self, columns):
+"""Find the Patient Name, DOB and Document Id columns (case insensitive)"""
 patient_name_col = None
 dob_col = None
-for col in df.columns:
+document_id_col = None
+for col in columns:
 col_lower = str(col).lower()
 if 'patient' in col_lower and 'name' in col_lower:
 patient_name_col = col
 elif 'dob' in col_lower or ('date' in col_lower and 'birth' in col_lower):
 dob_col = col
-if not patient_name_col:
-self.logger.error("Could not find 'Patient Name' column in Excel file")
-return None
-if not dob_col:
-self.logger.error("Could not find 'DOB' column in Excel file")
-return None
-# Check if row_index is valid
-if len(df) == 0:
-self.logger.error("No patient data found in Excel file")
-return None
-if row_index >= len(df):
-self.logger.error(f"Row index {row_index} is out of range. Excel file has {len(df)} rows.")
-return None
-# Get the specified row of data
-patient_data = df.iloc[row_index]
-patient_name = str(patient_data[patient_name_col]).strip()
-patient_dob = patient_data[dob_col]
+if 'document id' in col_lower and not document_id_col:
+document_id_col = col
+return patient_name_col, dob_col, document_id_col
+def _build_patient_record(self, row_index, patient_name, patient_dob, document_id, signed_orders_dir):
+"""Normalize one manifest row into a patient record"""
 # Format DOB if it's a datetime object
 if pd.notna(patient_dob):
 if hasattr(patient_dob, 'strftime'):
-# If it's a datetime object, format it
 patient_dob = patient_dob.strftime('%m/%d/%Y')
 else:
-# If it's already a string, clean it up
 patient_dob = str(patient_dob).strip()
 else:
 patient_dob = None
-# Get Document Id
-document_id_col = None
-for col in df.columns:
-if 'document id' in str(col).lower():
-document_id_col = col
-break
-if not document_id_col:
-self.logger.error("Could not find 'Document Id' column in Excel file")
-return None
-document_id = str(patient_data[document_id_col]).strip()
-project_root = Path(__file__).parent.parent
-pdf_path = project_root / "files" / "SignedOrders" / f"{document_id}.pdf"
-pdf_path = str(pdf_path.resolve())
-self.logger.info(f"Read patient data (row {row_index}) - Name: {patient_name}, DOB: {patient_dob}, Document Id: {document_id}, PDF Path: {pdf_path}")
+document_id = str(document_id).strip()
 return {
-'name': patient_name,
+'name': str(patient_name).strip(),
 'dob': patient_dob,
 'row_index': row_index,
 'document_id': document_id,
-'pdf_path': pdf_path
+'pdf_path': str(signed_orders_dir / f"{document_id}.pdf")
 }
+def _normalize_manifest_columns(self, df, patient_name_col, dob_col, document_id_col):
+"""Normalize all manifest rows column by column and flag rows with a usable patient name"""
+names = df[patient_name_col].astype(str).str.strip()
+# Skip rows with empty patient names
+valid_mask = ~names.str.lower().isin(['nan', 'none', ''])
+# Format DOB values, keeping non-date cells as cleaned strings
+dob_values = df[dob_col]
+if pd.api.types.is_datetime64_any_dtype(dob_values):
+dobs = dob_values.dt.strftime('%m/%d/%Y')
+else:
+dobs = dob_values.astype(str).str.strip()
+date_mask = dob_values.map(lambda value: hasattr(value, 'strftime')) & dob_values.notna()
+if date_mask.any():
+dobs[date_mask] = dob_values[date_mask].map(lambda value: value.strftime('%m/%d/%Y'))
+dobs = dobs.astype(object).where(dob_values.notna(), None)
+# Build every PDF path from a single resolved SignedOrders directory
+document_ids = df[document_id_col].astype(str).str.strip()
+signed_orders_dir = self._get_signed_orders_dir()
+pdf_paths = f"{signed_orders_dir}{os.sep}" + document_ids + ".pdf"
+records = pd.DataFrame({
+'name': names,
+'dob': dobs,
+'row_index': df.index,
+'document_id': document_ids,
+'pdf_path': pdf_paths
+}).to_dict('records')
+return records, valid_mask.tolist()
+def _read_manifest_frame(self, order_template_path):
+"""Read the order manifest as a DataFrame based on its file extension"""
+suffix = order_template_path.suffix.lower()
+if suffix == '.csv':
+return pd.read_csv(order_template_path)
+if suffix == '.parquet':
+return pd.read_parquet(order_template_path)
+if suffix in ('.feather', '.arrow'):
+return pd.read_feather(order_template_path)
+# Excel manifests can be converted once into a columnar sidecar that loads much faster
+if not self._load_config()['configuration'].get('OrderTemplateSidecar'):
+return pd.read_excel(order_template_path)
+sidecar_path = order_template_path.with_name(f".{order_template_path.name}.feather")
+if sidecar_path.exists() and sidecar_path.stat().st_mtime >= order_template_path.stat().st_mtime:
+try:
+df = pd.read_feather(sidecar_path)
+self.logger.info(f"Loaded cached sidecar: {sidecar_path.name}")
+return df
+except Exception as e:
+self.logger.warning(f"Could not read sidecar {sidecar_path}, re-reading Excel file: {str(e)}")
+# Read Excel file
+df = pd.read_excel(order_template_path)
+try:
+df.to_feather(sidecar_path)
+self.logger.info(f"Wrote columnar sidecar for later runs: {sidecar_path.name}")
+except ImportError:
+self.logger.debug("pyarrow not available for sidecar conversion")
+except Exception as e:
+self.logger.warning(f"Could not write sidecar {sidecar_path}: {str(e)}")
+return df
+def _load_manifest(self):
+"""Load OrderTemplate.xlsx through a cache keyed on path, mtime and size"""
+order_template_path = self._resolve_order_template_path()
+if not order_template_path:
+return None
+stat = Path(order_template_path).stat()
+cache_key = (str(Path(order_template_path).resolve()), stat.st_mtime, stat.st_size)
+manifest = self._manifest_cache.get(cache_key)
+if manifest:
+self.logger.debug(f"Using cached OrderTemplate.xlsx ({len(manifest['df'])} rows)")
+return manifest
+df = self._read_manifest_frame(Path(order_template_path))
+self.logger.info(f"Successfully read {Path(order_template_path).name} with {len(df)} rows")
+patient_name_col, dob_col, document_id_col = self._detect_manifest_columns(df.columns)
+records = []
+patients = []
+if patient_name_col and dob_col and document_id_col:
+records, valid_mask = self._normalize_manifest_columns(df, patient_name_col, dob_col, document_id_col)
+patients = [record for record, valid in zip(records, valid_mask) if valid]
+manifest = {
+'path': order_template_path,
+'df': df,
+'patient_name_col': patient_name_col,
+'dob_col': dob_col,
+'document_id_col': document_id_col,
+'records': records,
+'patients': patients
+}
+# Only keep the latest version of each manifest file
+self._manifest_cache = {key: value for key, value in self._manifest_cache.items() if key[0] != cache_key[0]}
+self._manifest_cache[cache_key] = manifest
+return manifest
+def _validate_manifest(self, manifest):
+"""Log and report missing columns or empty data in a loaded manifest"""
+if not manifest['patient_name_col']:
+self.logger.error("Could not find 'Patient Name' column in Excel file")
+return False
+if not manifest['dob_col']:
+self.logger.error("Could not find 'DOB' column in Excel file")
+return False
+if len(manifest['df']) == 0:
+self.logger.error("No patient data found in Excel file")
+return False
+if not manifest['document_id_col']:
+self.logger.error("Could not find 'Document Id' column in Excel file")
+return False
+return True
+def read_patient_data_from_excel(self, row_index=0):
+"""Read patient information from OrderTemplate.xlsx for a specific row, including Document Id and PDF path"""
+try:
+manifest = self._load_manifest()
+if not manifest or not self._validate_manifest(manifest):
+return None
+# Check if row_index is valid
+if row_index >= len(manifest['records']):
+self.logger.error(f"Row index {row_index} is out of range. Excel file has {len(manifest['records'])} rows.")
+return None
+patient = dict(manifest['records'][row_index])
+patient['row_index'] = row_index
+self.logger.info(f"Read patient data (row {row_index}) - Name: {patient['name']}, DOB: {patient['dob']}, Document Id: {patient['document_id']}, PDF Path: {patient['pdf_path']}")
+return patient
 except Exception as e:
 self.logger.error(f"Failed to read patient data from Excel: {str(e)}")
 return None
 def read_all_patients_from_excel(self, max_patients=None):
 """Read patient information from OrderTemplate.xlsx with optional limit, including Document Id and PDF path"""
 try:
-# Read config to get OrderTemplate path
-config_path = Path(__file__).parent.parent / 'config.json'
-with open(config_path, 'r') as f:
-config = json.load(f)
-order_template_path = config['configuration']['OrderTemplatePath']
-# Convert to absolute path from project root
-project_root = Path(__file__).parent.parent
-# If it's already a relative path, use it directly
-if not order_template_path.startswith('/') and not (len(order_template_path) > 1 and order_template_path[1] == ':'):
-order_template_path = project_root / order_template_path
-else:
-# Handle absolute paths by converting to relative
-if 'elation-emr' in order_template_path:
-# Split on 'elation-emr' and take the part after it
-relative_part = order_template_path.split('elation-emr', 1)[1]
-# Remove leading slash/backslash
-relative_part = relative_part.lstrip('/\\')
-order_template_path = project_root / relative_part
-else:
-# Fallback: try common relative paths
-potential_paths = [
-project_root / 'orders' / '2025-06-05' / 'docsathome_signed' / 'OrderTemplate.xlsx',
-project_root / 'OrderTemplate.xlsx',
-project_root / 'orders' / 'OrderTemplate.xlsx'
-]
-order_template_path = None
-for path in potential_paths:
-if path.exists():
-order_template_path = path
-break
-if not order_template_path:
-self.logger.error("Could not find OrderTemplate.xlsx in common locations")
+manifest = self._load_manifest()
+if not manifest or not self._validate_manifest(manifest):
 return []
-# Check if file exists
-if not order_template_path.exists():
-self.logger.error(f"OrderTemplate.xlsx not found at: {order_template_path}")
-# Try alternative search in project directory
-self.logger.info(f"Searching for OrderTemplate.xlsx in project directory: {project_root}")
-# Search for the file recursively
-xlsx_files = list(project_root.rglob('OrderTemplate.xlsx'))
-if xlsx_files:
-order_template_path = xlsx_files[0]
-self.logger.info(f"Found OrderTemplate.xlsx at: {order_template_path}")
-else:
-self.logger.error("OrderTemplate.xlsx not found anywhere in the project directory")
+patients = manifest['patients'] if max_patients is None else manifest['patients'][:max_patients]
+patients = [dict(patient) for patient in patients]
+limit_msg = f" (limited to {max_patients})" if max_patients else ""
+self.logger.info(f"Read {len(patients)} valid patients from Excel{limit_msg}")
+return patients
+except Exception as e:
+self.logger.error(f"Failed to read all patients from Excel: {str(e)}")
 return []
-# Read Excel file
-df = pd.read_excel(order_template_path)
-self.logger.info(f"Successfully read OrderTemplate.xlsx with {len(df)} rows")
-# Look for Patient Name and DOB columns (case insensitive)
-patient_name_col = None
-dob_col = None
-for col in df.columns:
-col_lower = str(col).lower()
-if 'patient' in col_lower and 'name' in col_lower:
-patient_name_col = col
-elif 'dob' in col_lower or ('date' in col_lower and 'birth' in col_lower):
-dob_col = col
-if not patient_name_col:
+def iter_patients_from_excel(self, max_patients=None):
+"""Yield patients from OrderTemplate.xlsx row by row using a read-only workbook"""
+order_template_path = self._resolve_order_template_path()
+if not order_template_path:
+return
+# A manifest that is already parsed and unchanged is cheaper to reuse than to stream
+stat = Path(order_template_path).stat()
+if (str(Path(order_template_path).resolve()), stat.st_mtime, stat.st_size) in self._manifest_cache:
+yield from self.read_all_patients_from_excel(max_patients=max_patients)
+return
+# Only Excel workbooks can be streamed; other formats load fast enough through the cache
+if Path(order_template_path).suffix.lower() not in ('.xlsx', '.xlsm'):
+yield from self.read_all_patients_from_excel(max_patients=max_patients)
+return
+try:
+from openpyxl import load_workbook
+except ImportError:
+self.logger.warning("openpyxl not available for streaming, loading full workbook instead")
+yield from self.read_all_patients_from_excel(max_patients=max_patients)
+return
+workbook = load_workbook(order_template_path, read_only=True, data_only=True)
+try:
+rows = workbook.active.iter_rows(values_only=True)
+header = next(rows, None)
+if not header:
+self.logger.error("No patient data found in Excel file")
+return
+patient_name_col, dob_col, document_id_col = self._detect_manifest_columns(header)
+if patient_name_col is None:
 self.logger.error("Could not find 'Patient Name' column in Excel file")
-return []
-if not dob_col:
+return
+if dob_col is None:
 self.logger.error("Could not find 'DOB' column in Excel file")
-return []
-# Get all rows of data
-if len(df) == 0:
-self.logger.error("No patient data found in Excel file")
-return []
-patients = []
-for index, row in df.iterrows():
-try:
+return
+if document_id_col is None:
+self.logger.error("Could not find 'Document Id' column in Excel file")
+return
+name_idx = header.index(patient_name_col)
+dob_idx = header.index(dob_col)
+document_id_idx = header.index(document_id_col)
+signed_orders_dir = self._get_signed_orders_dir()
+self.logger.info(f"Streaming patients from {Path(order_template_path).name}")
+yielded = 0
+for index, row in enumerate(rows):
 # Stop if we've reached the maximum number of patients
-if max_patients is not None and len(patients) >= max_patients:
+if max_patients is not None and yielded >= max_patients:
 break
-patient_name = str(row[patient_name_col]).strip()
-patient_dob = row[dob_col]
+try:
+row = tuple(row) + (None,) * (len(header) - len(row))
+patient = self._build_patient_record(
+index, row[name_idx], row[dob_idx], row[document_id_idx], signed_orders_dir
+)
 # Skip rows with empty patient names
-if not patient_name or patient_name.lower() in ['nan', 'none', '']:
+if not patient['name'] or patient['name'].lower() in ['nan', 'none', '']:
 continue
-# Format DOB if it's a datetime object
-if pd.notna(patient_dob):
-if hasattr(patient_dob, 'strftime'):
-# If it's a datetime object, format it
-patient_dob = patient_dob.strftime('%m/%d/%Y')
-else:
-# If it's already a string, clean it up
-patient_dob = str(patient_dob).strip()
-else:
-patient_dob = None
-# Get Document Id
-document_id_col = None
-for col in df.columns:
-if 'document id' in str(col).lower():
-document_id_col = col
-break
-if not document_id_col:
-self.logger.error("Could not find 'Document Id' column in Excel file")
-continue
-document_id = str(row[document_id_col]).strip()
-project_root = Path(__file__).parent.parent
-pdf_path = project_root / "files" / "SignedOrders" / f"{document_id}.pdf"
-pdf_path = str(pdf_path.resolve())
-patients.append({
-'name': patient_name,
-'dob': patient_dob,
-'row_index': index,
-'document_id': document_id,
-'pdf_path': pdf_path
-})
+yielded += 1
+yield patient
 except Exception as row_e:
 self.logger.warning(f"Error processing row {index}: {str(row_e)}")
 continue
-limit_msg = f" (limited to {max_patients})" if max_patients else ""
-self.logger.info(f"Read {len(patients)} valid patients from Excel{limit_msg}")
-return patients
+self.logger.info(f"Streamed {yielded} valid patients from Excel")
+finally:
+workbook.close()
+def _wait_until(self, condition, ceiling, poll_frequency=0.1):
+"""Wait until condition is truthy, returning its value or False once the ceiling (name or seconds) passes"""
+timeout = self.wait_timeouts.get(ceiling, 10) if isinstance(ceiling, str) else ceiling
+try:
+return WebDriverWait(self.driver, timeout, poll_frequency=poll_frequency).until(condition)
+except TimeoutException:
+self.logger.debug(f"Wait '{ceiling}' reached its {timeout}s ceiling")
+return False
+def _wait_for_page_ready(self, ceiling='page_ready'):
+"""Wait for the current document to finish loading"""
+return self._wait_until(
+lambda driver: driver.execute_script("return document.readyState") == 'complete',
+ceiling
+)
+def _wait_for_network_idle(self, idle_time=0.5, ceiling='network_idle'):
+"""Wait until no jQuery requests are active and no new resources load for idle_time seconds"""
+state = {'since': time.time()}
+def network_idle(driver):
+# Resource timings are cleared on every poll, so the count is what loaded since the last
+# poll and the browser's 250-entry timing buffer never fills up and stops counting
+activity = driver.execute_script(
+"var loaded = window.performance ? performance.getEntriesByType('resource').length : 0;"
+"if (loaded && performance.clearResourceTimings) { performance.clearResourceTimings(); }"
+"return [window.jQuery ? window.jQuery.active : 0, loaded];"
+)
+if activity[0] or activity[1]:
+state['since'] = time.time()
+return False
+return time.time() - state['since'] >= idle_time
+return self._wait_until(network_idle, ceiling)
+def _wait_for_element(self, locator, ceiling='element', clickable=False):
+"""Wait for an element to be present (or clickable) and return it, or None"""
+condition = EC.element_to_be_clickable(locator) if clickable else EC.presence_of_element_located(locator)
+return self._wait_until(condition, ceiling) or None
+def _wait_for_staleness(self, element, ceiling='navigation'):
+"""Wait for an element to be detached from the DOM"""
+return self._wait_until(EC.staleness_of(element), ceiling)
+def _wait_for_navigation(self, previous_url, element=None, ceiling='navigation'):
+"""Wait for the URL to change or for an element of the old page to go stale"""
+def navigated(driver):
+if driver.current_url != previous_url:
+return True
+if element is not None:
+try:
+element.is_enabled()
+except StaleElementReferenceException:
+return True
+return False
+return self._wait_until(navigated, ceiling)
+def _wait_for_new_tab(self, handle_count, ceiling='new_tab'):
+"""Wait for a new browser tab to open beyond the given count"""
+return self._wait_until(lambda driver: len(driver.window_handles) > handle_count, ceiling)
+def _wait_for_dialog_open(self, ceiling='dialog_open'):
+"""Wait for the upload dialog to become visible"""
+return self._wait_until(EC.visibility_of_element_located((By.ID, "ui-id-4")), ceiling)
+def _wait_for_dialog_close(self, ceiling='dialog_close'):
+"""Wait for the upload dialog to be hidden or removed"""
+return self._wait_until(EC.invisibility_of_element_located((By.ID, "ui-id-4")), ceiling)
+def _load_selector_stats(self):
+"""Load persisted selector statistics"""
+if self._selector_stats is None:
+try:
+with open(Path(__file__).parent.parent / '.selector_stats.json', 'r') as f:
+self._selector_stats = json.load(f)
+except (OSError, ValueError):
+self._selector_stats = {}
+return self._selector_stats
+def _save_selector_stats(self):
+"""Persist selector statistics so the next run starts with the learned order"""
+if self._selector_stats is None:
+return
+try:
+self._write_json_atomic(Path(__file__).parent.parent / '.selector_stats.json', self._selector_stats)
+self._selector_stats_saved_at = time.time()
 except Exception as e:
-self.logger.error(f"Failed to read all patients from Excel: {str(e)}")
-return []
-def _find_element(self, selectors, timeout=5):
-"""Find element with multiple selectors"""
+self.logger.warning(f"Could not save selector statistics: {str(e)}")
+def _selector_key(self, selector):
+"""Stable statistics key for a selector"""
+return f"{selector[0]}:{selector[1]}"
+def _rank_selectors(self, cascade, selectors):
+"""Order a selector cascade by observed hit rate, then latency, then original position"""
+stats = self._load_selector_stats().get(cascade, {})
+def rank(item):
+index, selector = item
+entry = stats.get(self._selector_key(selector))
+if not entry:
+return (-0.5, 0, index)
+# Smoothed hit rate so one early miss doesn't bury a selector
+hit_rate = (entry['hits'] + 1) / (entry['hits'] + entry['misses'] + 2)
+return (-hit_rate, entry['latency'], index)
+return [selector for index, selector in sorted(enumerate(selectors), key=rank)]
+def _record_selector_result(self, cascade, selector, hit, latency=0.0):
+"""Record a selector hit (with time to match) or miss for a cascade"""
+stats = self._load_selector_stats().setdefault(cascade, {})
+entry = stats.setdefault(self._selector_key(selector), {'hits': 0, 'misses': 0, 'latency': 0.0})
+if hit:
+entry['hits'] += 1
+entry['latency'] = latency if entry['hits'] == 1 else 0.8 * entry['latency'] + 0.2 * latency
+else:
+entry['misses'] += 1
+# Decay old counts so a UI change re-ranks the cascade within a few dozen lookups
+if entry['hits'] + entry['misses'] > 50:
+entry['hits'] //= 2
+entry['misses'] //= 2
+if time.time() - self._selector_stats_saved_at > 30:
+self._save_selector_stats()
+def _resolve_selectors(self, selectors, timeout=5, clickable=False, cascade=None):
+"""Race all selectors in one injected script per poll and return (element, winning selector)"""
+if cascade:
+selectors = self._rank_selectors(cascade, selectors)
+# Translate locators to CSS where possible so the page can evaluate them all in one call
+locators = []
+for by, value in selectors:
+if by == By.XPATH:
+locators.append(['xpath', value])
+elif by == By.ID:
+locators.append(['css', f'[id="{value}"]'])
+elif by == By.NAME:
+locators.append(['css', f'[name="{value}"]'])
+elif by == By.CLASS_NAME:
+locators.append(['css', f'.{value}'])
+else:
+locators.append(['css', value])
+def first_match(driver):
+return driver.execute_script(self._RACE_SELECTORS_SCRIPT, locators, clickable)
+start_time = time.time()
+match = self._wait_until(first_match, timeout)
+if not match:
+if cascade:
 for selector in selectors:
+self._record_selector_result(cascade, selector, False)
+return None, None
+index, element = match
+self.logger.debug(f"Selector {index+1}/{len(selectors)} won: {selectors[index][1]}")
+if cascade:
+# Every higher-ranked selector was checked and had no match
+for selector in selectors[:index]:
+self._record_selector_result(cascade, selector, False)
+self._record_selector_result(cascade, selectors[index], True, time.time() - start_time)
+return element, selectors[index]
+def _find_element(self, selectors, timeout=5, cascade=None):
+"""Find element with multiple selectors"""
 try:
-element = WebDriverWait(self.driver, timeout).until(
-EC.element_to_be_clickable(selector)
-)
-if element:
+element, selector = self._resolve_selectors(selectors, timeout=timeout, clickable=True, cascade=cascade)
 return element
-except:
-continue
+except Exception as e:
+self.logger.debug(f"Selector resolution failed: {str(e)}")
 return None
 def _find_search_bar(self, timeout=30):
 """Specifically find the search bar with detailed logging"""
@@ -319,14 +836,10 @@ search_selectors = [
 (By.CSS_SELECTOR, 'input[placeholder*="search" i]')
 ]
 self.logger.info(f"Looking for search bar with {len(search_selectors)} selectors...")
-for i, selector in enumerate(search_selectors):
 try:
-self.logger.debug(f"Trying selector {i+1}: {selector[1]}")
-element = WebDriverWait(self.driver, 2).until(
-EC.presence_of_element_located(selector)
-)
-if element and element.is_displayed():
-self.logger.info(f"✅ Found search bar with selector {i+1}: {selector[1]}")
+element, selector = self._resolve_selectors(search_selectors, timeout=timeout, cascade='search_bar')
+if element:
+self.logger.info(f"✅ Found search bar with selector {search_selectors.index(selector)+1}: {selector[1]}")
 # If it's not an input, look for input inside
 if element.tag_name != 'input':
 try:
@@ -347,11 +860,18 @@ return element
 else:
 return element
 except Exception as e:
-self.logger.debug(f"Selector {i+1} failed: {str(e)}")
-continue
+self.logger.debug(f"Search bar lookup failed: {str(e)}")
 self.logger.error("❌ Search bar not found with any selector")
 return None
-def login(self, username=None, password=None, url=None):
+def login(self, username=None, password=None, url=None, restore_only=False):
+"""Login to Elation EMR, reusing a saved session when possible (restore_only never starts an interactive login)"""
+if restore_only:
+return self._restore_session(url or self.settings.ELATION_URL)
+logged_in = self._login(username, password, url)
+if logged_in:
+self._save_session_cookies()
+return logged_in
+def _login(self, username=None, password=None, url=None):
 """Login to Elation EMR with Google Authenticator support"""
 try:
 login_url = url or self.settings.ELATION_URL
@@ -359,6 +879,9 @@ login_username = username or self.settings.ELATION_USERNAME
 login_password = password or self.settings.ELATION_PASSWORD
 if not all([login_url, login_username, login_password]):
 raise ValueError("Missing credentials")
+# Reuse the saved session when it is still valid to skip login and 2FA
+if self._restore_session(login_url):
+return True
 self.logger.info("Starting login...")
 self.driver.get(login_url)
 # Username entry
@@ -368,7 +891,7 @@ username_selectors = [
 (By.CSS_SELECTOR, 'input[type="email"]'),
 (By.ID, "username")
 ]
-username_element = self._find_element(username_selectors, timeout=8)
+username_element = self._find_element(username_selectors, timeout=8, cascade='login_username')
 if not username_element:
 self.logger.error("Username field not found")
 return False
@@ -380,19 +903,19 @@ next_selectors = [
 (By.CSS_SELECTOR, 'button[type="submit"]'),
 (By.XPATH, "//button[contains(text(), 'Next')]")
 ]
-next_button = self._find_element(next_selectors, timeout=3)
+next_button = self._find_element(next_selectors, timeout=3, cascade='login_next')
 if next_button:
 next_button.click()
 else:
 username_element.send_keys(Keys.RETURN)
-time.sleep(1)
+self._wait_for_page_ready()
 # Password entry
 password_selectors = [
 (By.NAME, "password"),
 (By.CSS_SELECTOR, 'input[type="password"]'),
 (By.ID, "password")
 ]
-password_element = self._find_element(password_selectors, timeout=8)
+password_element = self._find_element(password_selectors, timeout=8, cascade='login_password')
 if not password_element:
 self.logger.error("Password field not found")
 return False
@@ -415,13 +938,15 @@ login_selectors = [
 (By.CSS_SELECTOR, 'button[type="submit"]'),
 (By.XPATH, "//button[contains(text(), 'Login')]")
 ]
-login_button = self._find_element(login_selectors, timeout=3)
+login_button = self._find_element(login_selectors, timeout=3, cascade='login_submit')
+previous_url = self.driver.current_url
 if login_button:
 login_button.click()
 else:
 password_element.send_keys(Keys.RETURN)
 # Initial verification to see if 2FA is required
-time.sleep(3)
+self._wait_for_navigation(previous_url, element=password_element)
+self._wait_for_page_ready()
 current_url = self.driver.current_url.lower()
 # First check if we're already logged in successfully (search bar is visible)
 try:
@@ -439,33 +964,15 @@ self.logger.info("✅ Login successful - search bar found!")
 return True
 except Exception as e:
 self.logger.debug(f"Search bar not found yet: {str(e)}")
-# Check if we're on a 2FA/authenticator page
-auth_keywords = ['2fa', 'authenticator', 'verification', 'verify', 'code', 'token']
-page_source = self.driver.page_source.lower()
-needs_2fa = any(keyword in page_source for keyword in auth_keywords)
+# Check if we're on a 2FA/authenticator page (checked in the page, without downloading its source)
+auth_state = self._probe_auth_state()
+needs_2fa = auth_state['auth_text']
 # Also check if we're still on login page or redirected to 2FA page
 if 'login' in current_url or 'signin' in current_url or needs_2fa:
 # Check specifically for Google Authenticator or 2FA elements
-two_fa_selectors = [
-(By.CSS_SELECTOR, 'input[placeholder*="code" i]'),
-(By.CSS_SELECTOR, 'input[placeholder*="authenticator" i]'),
-(By.CSS_SELECTOR, 'input[placeholder*="verification" i]'),
-(By.NAME, "code"),
-(By.NAME, "token"),
-(By.NAME, "otp"),
-(By.ID, "code"),
-(By.ID, "token"),
-(By.ID, "otp")
-]
-two_fa_element = None
-for selector in two_fa_selectors:
-try:
-two_fa_element = WebDriverWait(self.driver, 2).until(
-EC.presence_of_element_located(selector)
+two_fa_element = auth_state['two_fa'] or self._wait_until(
+lambda driver: self._probe_auth_state()['two_fa'], 2, poll_frequency=0.25
 )
-break
-except:
-continue
 if two_fa_element:
 self.logger.info("🔐 Google Authenticator required!")
 print("\n" + "="*60)
@@ -477,33 +984,10 @@ print("\nWaiting 10 minutes for you to complete 2FA...")
 print("The automation will continue after you submit the code.")
 print("="*60)
 # Wait for 10 minutes (600 seconds) for user to enter 2FA code
-wait_time = 600 # 10 minutes
-start_time = time.time()
-while time.time() - start_time < wait_time:
-try:
-# Check if we've been redirected away from the 2FA page
-current_url = self.driver.current_url.lower()
-if 'login' not in current_url and 'signin' not in current_url and 'verify' not in current_url:
+if self._wait_for_2fa_completion(wait_time=600):
 self.logger.info("✅ 2FA completed successfully!")
 print("✅ 2FA completed! Continuing with automation...")
 return True
-# Also check for search bar during 2FA wait
-try:
-search_box = self._find_search_bar(timeout=2)
-if search_box:
-self.logger.info("✅ 2FA completed - search bar found!")
-print("✅ 2FA completed! Continuing with automation...")
-return True
-except:
-pass
-# Wait 10 seconds before checking again
-time.sleep(10)
-remaining_time = wait_time - (time.time() - start_time)
-if remaining_time > 0:
-print(f"⏳ Waiting... {int(remaining_time//60)}:{int(remaining_time%60):02d} remaining")
-except Exception as e:
-self.logger.debug(f"Error during 2FA wait: {str(e)}")
-time.sleep(10)
 # Final check after 10 minutes
 current_url = self.driver.current_url.lower()
 if 'login' not in current_url and 'signin' not in current_url and 'verify' not in current_url:
@@ -548,6 +1032,87 @@ return True
 except Exception as e:
 self.logger.error(f"Login error: {str(e)}")
 return False
+def _probe_auth_state(self):
+"""Read URL, search bar and 2FA field state in a single script call"""
+return self.driver.execute_script(
+self._AUTH_STATE_SCRIPT,
+'#chart-home-patient-search, input[placeholder*="Find patient chart" i]',
+'input[placeholder*="code" i], input[placeholder*="authenticator" i], input[placeholder*="verification" i], '
+'[name="code"], [name="token"], [name="otp"], #code, #token, #otp'
+)
+def _wait_for_2fa_completion(self, wait_time=600, poll_interval=0.25):
+"""Poll the cheap auth-state probe until 2FA is completed or wait_time passes"""
+start_time = time.time()
+last_report = start_time
+while time.time() - start_time < wait_time:
+try:
+auth_state = self._probe_auth_state()
+current_url = auth_state['url'].lower()
+# Done once the search bar shows or we've been redirected away from the 2FA page
+if auth_state['search_bar'] or ('login' not in current_url and 'signin' not in current_url and 'verify' not in current_url):
+return True
+except Exception as e:
+self.logger.debug(f"Error during 2FA wait: {str(e)}")
+if time.time() - last_report >= 30:
+last_report = time.time()
+remaining_time = wait_time - (last_report - start_time)
+print(f"⏳ Waiting... {int(remaining_time//60)}:{int(remaining_time%60):02d} remaining")
+time.sleep(poll_interval)
+return False
+def _save_session_cookies(self):
+"""Save the authenticated session's cookies so later runs can skip login"""
+try:
+cookies = self.driver.get_cookies()
+# Cookies grant access to the account, so keep the file readable by the owner only
+fd = os.open(self.session_cookie_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+# The mode above only applies to new files, so tighten an existing jar before writing to it
+os.chmod(self.session_cookie_path, 0o600)
+with os.fdopen(fd, 'w') as f:
+json.dump(cookies, f)
+self.logger.info(f"Saved session cookies ({len(cookies)})")
+except Exception as e:
+self.logger.warning(f"Could not save session cookies: {str(e)}")
+def _restore_session(self, login_url):
+"""Load saved cookies and probe whether the session is still logged in"""
+if not Path(self.session_cookie_path).exists():
+return False
+try:
+with open(self.session_cookie_path, 'r') as f:
+cookies = json.load(f)
+# Cookies can only be added for the domain currently loaded
+self.driver.get(login_url)
+host = urlparse(self.driver.current_url).hostname or ''
+restored = 0
+for cookie in cookies:
+domain = cookie.get('domain', '').lstrip('.')
+if domain and not host.endswith(domain):
+continue
+if cookie.get('expiry') and cookie['expiry'] < time.time():
+continue
+try:
+self.driver.add_cookie(cookie)
+restored += 1
+except Exception:
+continue
+if not restored:
+self.logger.info("No usable saved session cookies, logging in")
+return False
+self.driver.get(login_url)
+self._wait_for_page_ready()
+if self._is_session_valid():
+self.logger.info("✅ Restored saved session - login skipped")
+return True
+self.logger.info("Saved session is no longer valid, logging in")
+except Exception as e:
+self.logger.debug(f"Could not restore saved session: {str(e)}")
+return False
+def _is_session_valid(self):
+"""Quick probe for the logged-in home page"""
+element, selector = self._resolve_selectors([
+(By.CSS_SELECTOR, '#chart-home-patient-search'),
+(By.CSS_SELECTOR, 'input[placeholder*="Find patient chart" i]')
+], timeout=self.wait_timeouts['session_probe'])
+return element is not None
 def search_patient(self, patient_name=None, patient_id=None, patient_dob=None):
 """Search for patient using provided name and DOB and capture Attributed To name"""
 try:
@@ -560,6 +1125,7 @@ if patient_dob:
 search_term = f"{patient_name} {patient_dob}"
 if not search_term:
 raise ValueError("Patient name or ID required")
+self.current_patient = {'name': patient_name, 'dob': patient_dob}
 self.logger.info(f"Searching for: {search_term}")
 # Find search box using dedicated method with detailed logging
 search_box = self._find_search_bar(timeout=10)
@@ -569,7 +1135,7 @@ return False
 # Search using name and DOB
 search_box.clear()
 search_box.send_keys(search_term)
-time.sleep(1.5)
+self._wait_for_network_idle()
 # Try to capture "Attributed To" name using the specific selector provided by user
 try:
 attributed_element = WebDriverWait(self.driver, 5).until(
@@ -593,7 +1159,7 @@ self.logger.info(f"Captured Attributed To using specific selector: {self.attribu
 except:
 self.logger.debug("Specific attributed selector not found, trying fallback methods")
 # Wait for search results to appear
-time.sleep(2)
+self._wait_for_network_idle()
 # Try the user provided specific selector first
 result_selectors = [
 (By.CSS_SELECTOR, '#floating-ui-2 > div > div > li:nth-child(1) > a'), # User provided selector
@@ -604,10 +1170,15 @@ result_selectors = [
 (By.CSS_SELECTOR, '.patient-result'),
 (By.CSS_SELECTOR, '.patient-item')
 ]
+direct_selectors = result_selectors[:3]
+# Only the equivalent first-result selectors are reordered; the broad fallbacks
+# match almost any page, so they always run last and in their original order
+result_selectors = self._rank_selectors('search_result', direct_selectors) + result_selectors[3:]
 for i, selector in enumerate(result_selectors):
+selector_start = time.time()
 try:
 self.logger.debug(f"Trying patient result selector {i+1}: {selector[1]}")
-if i < 3: # For the specific selectors, try direct click
+if selector in direct_selectors: # For the specific selectors, try direct click
 element = WebDriverWait(self.driver, 5).until(
 EC.element_to_be_clickable(selector)
 )
@@ -615,13 +1186,16 @@ if element and element.is_displayed():
 self.logger.info(f"✅ Found patient result with selector {i+1}: {selector[1]}")
 # Click the patient result
 self.logger.info("Clicking first patient result")
+handle_count = len(self.driver.window_handles)
 element.click()
-time.sleep(2)
+self._wait_for_new_tab(handle_count)
 # Check for new tab
 if len(self.driver.window_handles) > 1:
 self.driver.switch_to.window(self.driver.window_handles[-1])
 self.logger.info("Switched to patient chart")
+self._record_selector_result('search_result', selector, True, time.time() - selector_start)
 return True
+self._record_selector_result('search_result', selector, False)
 else: # For fallback selectors, use the old logic
 results = self.driver.find_elements(*selector)
 for result in results:
@@ -666,9 +1240,9 @@ attributed_text_selectors = [
 ".//div[contains(text(), 'Attributed') or contains(text(), 'Provider')]",
 ".//td[contains(text(), 'Attributed') or contains(text(), 'Provider')]"
 ]
-for selector in attributed_text_selectors:
+for attr_text_selector in attributed_text_selectors:
 try:
-elements = search_results_area.find_elements(By.XPATH, selector)
+elements = search_results_area.find_elements(By.XPATH, attr_text_selector)
 for elem in elements:
 text = elem.text.strip()
 if ":" in text:
@@ -687,8 +1261,9 @@ except Exception as e:
 self.logger.debug(f"Could not capture Attributed To name using fallback: {str(e)}")
 # Now click the patient result
 self.logger.info("Clicking patient result")
+handle_count = len(self.driver.window_handles)
 result.click()
-time.sleep(2)
+self._wait_for_new_tab(handle_count)
 # Check for new tab
 if len(self.driver.window_handles) > 1:
 self.driver.switch_to.window(self.driver.window_handles[-1])
@@ -696,6 +1271,8 @@ self.logger.info("Switched to patient chart")
 return True
 except Exception as e:
 self.logger.debug(f"Selector {i+1} failed: {str(e)}")
+if selector in direct_selectors: # Only the ranked selectors keep statistics
+self._record_selector_result('search_result', selector, False)
 continue
 self.logger.error("No patient results found")
 return False
@@ -735,37 +1312,220 @@ return True
 except Exception as e:
 self.logger.error(f"Failed to open file explorer: {str(e)}")
 return False
+def _screen_scale(self):
+"""Ratio of screenshot pixels to the screen points pyautogui moves the mouse in"""
+if self._screen_scale_factor is None:
+try:
+self._screen_scale_factor = pyautogui.screenshot().size[0] / pyautogui.size()[0]
+except Exception as e:
+self.logger.debug(f"Screen scale not available, assuming 1.0: {str(e)}")
+self._screen_scale_factor = 1.0
+return self._screen_scale_factor
+def _to_screen_point(self, x, y):
+"""Convert screenshot pixel coordinates to a pyautogui screen point"""
+scale = self._screen_scale()
+return (int(x / scale), int(y / scale))
+def _capture_screen(self, region=None):
+"""Capture region (left, top, width, height) in screenshot pixels clipped to the screen, or the full screen, with its pixel offset"""
+if region:
+# Regions come in device pixels while pyautogui.size() reports points
+scale = self._screen_scale()
+screen_width, screen_height = (int(size * scale) for size in pyautogui.size())
+left = max(0, int(region[0]))
+top = max(0, int(region[1]))
+right = min(screen_width, int(region[0] + region[2]))
+bottom = min(screen_height, int(region[1] + region[3]))
+if right > left and bottom > top:
+return pyautogui.screenshot(region=(left, top, right - left, bottom - top)), (left, top)
+return pyautogui.screenshot(), (0, 0)
+def _grab_gray_frame(self, region=None):
+"""Capture the screen (or region) as float32 grayscale in a reused buffer, returning the image, frame and offset"""
+screenshot, offset = self._capture_screen(region)
+# PIL converts to 8-bit luma in C, so no full-frame float64 temporaries are created
+gray = np.asarray(screenshot.convert('L'))
+size = gray.shape[0] * gray.shape[1]
+if self._frame_buffer is None or self._frame_buffer.size < size:
+self._frame_buffer = np.empty(size, dtype=np.float32)
+# A prefix of the flat buffer gives a contiguous frame for any capture size
+frame = self._frame_buffer[:size].reshape(gray.shape)
+np.copyto(frame, gray)
+return screenshot, frame, offset
+def _active_window_region(self):
+"""Screen bounds of the focused window (e.g. the file manager), if the platform reports them"""
+try:
+window = pyautogui.getActiveWindow()
+if window and window.width > 0 and window.height > 0:
+# Window bounds are in screen points, captures are in pixels
+scale = self._screen_scale()
+return (window.left * scale, window.top * scale, window.width * scale, window.height * scale)
+except Exception as e:
+self.logger.debug(f"Active window bounds not available: {str(e)}")
+return None
+def _browser_screen_region(self, css_selector=None, margin=20):
+"""Screen bounds in device pixels of the browser window, or of an element in it (with a margin), from WebDriver rects"""
+if not self.driver:
+return None
+try:
+if not css_selector:
+# The window rect is in CSS pixels as well
+ratio = self.driver.execute_script("return window.devicePixelRatio || 1;")
+rect = self.driver.get_window_rect()
+return (rect['x'] * ratio, rect['y'] * ratio, rect['width'] * ratio, rect['height'] * ratio)
+rect = self.driver.execute_script(self._SCREEN_RECT_SCRIPT, css_selector)
+if rect:
+return (rect[0] - margin, rect[1] - margin, rect[2] + 2 * margin, rect[3] + 2 * margin)
+except Exception as e:
+self.logger.debug(f"Browser bounds not available: {str(e)}")
+return None
+def _get_template(self, template_path, scales=(1.0,)):
+"""Load a template once as float32 grayscale and precompute the requested scaled variants"""
+template_path = Path(template_path)
+key = (str(template_path.resolve()), template_path.stat().st_mtime)
+template = self._templates.get(key)
+if template is None:
+template_rgb = np.asarray(Image.open(template_path).convert('RGB'), dtype=np.float32)
+template = {'gray': template_rgb @ np.array([0.2989, 0.5870, 0.1140], dtype=np.float32), 'variants': {}}
+# Drop variants of older versions of the same file
+self._templates = {cached: value for cached, value in self._templates.items() if cached[0] != key[0]}
+self._templates[key] = template
+self.logger.info(f"📋 Template loaded: {template_path.name} ({template['gray'].shape})")
+for scale in scales:
+if scale not in template['variants']:
+template['variants'][scale] = self._scale_template(template['gray'], scale)
+return template
+def _scale_template(self, template_gray, scale):
+"""Resize a grayscale template and precompute its zero-mean copy and norm, or None if it vanishes"""
+if scale != 1.0:
+new_height = int(template_gray.shape[0] * scale)
+new_width = int(template_gray.shape[1] * scale)
+if new_width <= 0 or new_height <= 0:
+return None
+image = transform.resize(template_gray, (new_height, new_width), anti_aliasing=True, preserve_range=True).astype(np.float32)
+else:
+image = template_gray
+zero_mean = image - image.mean()
+return {'image': image, 'zero_mean': zero_mean, 'norm': float(np.sqrt(np.sum(zero_mean * zero_mean)))}
+def _downsample(self, image, factor):
+"""Shrink a 2-D array by an integer factor using block means"""
+if factor <= 1:
+return image
+height = image.shape[0] // factor * factor
+width = image.shape[1] // factor * factor
+return image[:height, :width].reshape(height // factor, factor, width // factor, factor).mean(axis=(1, 3), dtype=np.float32)
+def _match_template_near_hint(self, screenshot_gray, template, hint, offset, threshold, radius=24):
+"""Check a template's last matched position, then a small window around it, in a screenshot captured at offset"""
+variant = template['variants'].get(hint['scale'])
+if not variant:
+return None
+image = variant['image']
+h, w = image.shape[:2]
+x = hint['location'][0] - offset[0]
+y = hint['location'][1] - offset[1]
+if x >= 0 and y >= 0 and y + h <= screenshot_gray.shape[0] and x + w <= screenshot_gray.shape[1]:
+# Normalized cross-correlation at a single position using the precomputed template norm
+patch = screenshot_gray[y:y + h, x:x + w]
+patch_zero_mean = patch - patch.mean()
+denominator = variant['norm'] * float(np.sqrt(np.sum(patch_zero_mean * patch_zero_mean)))
+confidence = float(np.sum(patch_zero_mean * variant['zero_mean']) / denominator) if denominator else 0.0
+if confidence > threshold:
+return {'confidence': confidence, 'location': (x, y), 'size': (w, h), 'scale': hint['scale']}
+top = max(0, y - radius)
+left = max(0, x - radius)
+window = screenshot_gray[top:max(0, y + h + radius), left:max(0, x + w + radius)]
+if window.shape[0] < h or window.shape[1] < w:
+return None
+result = feature.match_template(window, image)
+max_loc = np.unravel_index(np.argmax(result), result.shape)
+confidence = float(result[max_loc])
+if confidence > threshold:
+return {'confidence': confidence, 'location': (left + int(max_loc[1]), top + int(max_loc[0])), 'size': (w, h), 'scale': hint['scale']}
+return None
+def _match_template(self, screenshot_gray, template, scales, threshold, hint_key=None, offset=(0, 0), coarse_factor=4, candidates=3):
+"""Score each scale on a downsampled screenshot, then refine the best candidates at full resolution until one passes threshold"""
+best_match = None
+hint = self._template_hints.get(hint_key) if hint_key else None
+if hint:
+best_match = self._match_template_near_hint(screenshot_gray, template, hint, offset, threshold)
+if best_match:
+self.logger.debug(f"Template matched at its last known position with confidence {best_match['confidence']:.3f}")
+if not best_match:
+best_match = self._search_template(screenshot_gray, template, scales, threshold, coarse_factor, candidates)
+if hint_key and best_match and best_match['confidence'] > threshold:
+self._template_hints[hint_key] = {
+'location': (offset[0] + best_match['location'][0], offset[1] + best_match['location'][1]),
+'scale': best_match['scale'],
+'confidence': best_match['confidence']
+}
+return best_match
+def _search_template(self, screenshot_gray, template, scales, threshold, coarse_factor=4, candidates=3):
+"""Search the whole screenshot for a template, coarse-to-fine across scales"""
+coarse_screens = {}
+coarse_matches = []
+for scale in scales:
+variant = template['variants'].get(scale)
+if not variant:
+continue
+image = variant['image']
+# Skip if template is larger than screenshot
+if image.shape[0] > screenshot_gray.shape[0] or image.shape[1] > screenshot_gray.shape[1]:
+continue
+# Keep coarse templates at least 8 pixels across so they stay distinctive
+factor = max(1, min(coarse_factor, min(image.shape[:2]) // 8))
+if factor not in coarse_screens:
+coarse_screens[factor] = self._downsample(screenshot_gray, factor)
+coarse_templates = variant.setdefault('coarse', {})
+if factor not in coarse_templates:
+coarse_templates[factor] = self._downsample(image, factor)
+result = feature.match_template(coarse_screens[factor], coarse_templates[factor])
+max_loc = np.unravel_index(np.argmax(result), result.shape)
+coarse_matches.append((float(result[max_loc]), scale, factor, max_loc))
+self.logger.debug(f"Scale {scale}: coarse confidence {result[max_loc]:.3f}")
+best_match = None
+coarse_matches.sort(key=lambda match: match[0], reverse=True)
+for coarse_confidence, scale, factor, (row, col) in coarse_matches[:candidates]:
+image = template['variants'][scale]['image']
+h, w = image.shape[:2]
+# Search the full-resolution pixels around the coarse hit
+pad = 2 * factor
+top = max(0, row * factor - pad)
+left = max(0, col * factor - pad)
+window = screenshot_gray[top:row * factor + h + pad, left:col * factor + w + pad]
+if window.shape[0] < h or window.shape[1] < w:
+continue
+result = feature.match_template(window, image)
+max_loc = np.unravel_index(np.argmax(result), result.shape)
+confidence = float(result[max_loc])
+self.logger.debug(f"Scale {scale}: refined confidence {confidence:.3f} (coarse {coarse_confidence:.3f})")
+if not best_match or confidence > best_match['confidence']:
+best_match = {
+'confidence': confidence,
+'location': (left + int(max_loc[1]), top + int(max_loc[0])), # Convert (y,x) to (x,y)
+'size': (w, h),
+'scale': scale
+}
+if confidence > threshold:
+break
+return best_match
 def _find_file_using_computer_vision(self, file_name, template_image='file_thumbnail.png'):
 """Use computer vision to locate the file in Explorer"""
 try:
 self.logger.info(f"Looking for file: {file_name}")
-# Take a screenshot
-screenshot = pyautogui.screenshot()
-screenshot_np = np.array(screenshot)
-# Convert to grayscale for template matching
-screenshot_gray = np.dot(screenshot_np[...,:3], [0.2989, 0.5870, 0.1140])
+# Only capture the file manager window when its bounds are known, as grayscale for template matching
+screenshot, screenshot_gray, (offset_x, offset_y) = self._grab_gray_frame(self._active_window_region())
 # Load the template image
 try:
-template_pil = Image.open(template_image)
-template_np = np.array(template_pil)
-if len(template_np.shape) == 3:
-template_gray = np.dot(template_np[...,:3], [0.2989, 0.5870, 0.1140])
-else:
-template_gray = template_np
+template = self._get_template(template_image)
 except Exception as e:
 self.logger.error(f"Could not load template image: {template_image}, error: {e}")
 return None
 # Perform template matching using normalized cross-correlation
-result = feature.match_template(screenshot_gray, template_gray)
-# Find the best match
-max_loc = np.unravel_index(np.argmax(result), result.shape)
-max_val = result[max_loc]
+confidence_threshold = 0.7
+best_match = self._match_template(screenshot_gray, template, (1.0,), confidence_threshold, hint_key=template_image, offset=(offset_x, offset_y))
 # If good match found
-if max_val > 0.7: # Confidence threshold
-# Get center of match (note: match_template returns (y, x) format)
-h, w = template_gray.shape[:2]
-center_x = max_loc[1] + w//2
-center_y = max_loc[0] + h//2
+if best_match and best_match['confidence'] > confidence_threshold:
+# Get center of match
+w, h = best_match['size']
+center_x, center_y = self._to_screen_point(offset_x + best_match['location'][0] + w//2, offset_y + best_match['location'][1] + h//2)
 self.logger.info(f"Found file at coordinates: ({center_x}, {center_y})")
 return (center_x, center_y)
 self.logger.warning("Could not find file icon")
@@ -800,34 +1560,94 @@ return None
 except Exception as e:
 self.logger.error(f"Fallback detection failed: {str(e)}")
 return None
+def _get_ocr_engine(self):
+"""Start a tesserocr engine in sparse-text mode once and keep it warm, or None to use pytesseract"""
+if self._ocr_engine is None:
+try:
+import tesserocr
+self._ocr_engine = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SPARSE_TEXT)
+self.logger.info("OCR engine started (tesserocr)")
+except Exception as e:
+self.logger.debug(f"tesserocr not available, using pytesseract: {str(e)}")
+self._ocr_engine = False
+return self._ocr_engine or None
+def _run_ocr(self, image):
+"""Return the words tesseract finds in a grayscale image, with their bounding boxes"""
+words = []
+engine = self._get_ocr_engine()
+if engine:
+import tesserocr
+engine.SetImage(image)
+engine.Recognize()
+level = tesserocr.RIL.WORD
+for word in tesserocr.iterate_level(engine.GetIterator(), level):
+text = word.GetUTF8Text(level)
+box = word.BoundingBox(level)
+if text and text.strip() and box:
+words.append({'text': text, 'left': box[0], 'top': box[1], 'width': box[2] - box[0], 'height': box[3] - box[1]})
+return words
+import pytesseract
+# psm 11 finds sparse text without full page layout analysis
+ocr_data = pytesseract.image_to_data(image, config='--psm 11', output_type=pytesseract.Output.DICT)
+for i, text in enumerate(ocr_data['text']):
+if text.strip():
+words.append({'text': text, 'left': ocr_data['left'][i], 'top': ocr_data['top'][i], 'width': ocr_data['width'][i], 'height': ocr_data['height'][i]})
+return words
+def _ocr_words(self, image, offset=(0, 0), purpose='default'):
+"""OCR an image captured at offset and return its words in screen coordinates, cached by region hash"""
+gray = image.convert('L')
+# Downscale when earlier results show the text is larger than tesseract needs
+scale = 1.0
+text_height = self._ocr_text_heights.get(purpose)
+if text_height and text_height > 32:
+scale = 24 / text_height
+gray = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.LANCZOS)
+key = (hashlib.blake2b(gray.tobytes(), digest_size=16).hexdigest(), gray.size)
+words = self._ocr_cache.get(key)
+if words is None:
+words = self._run_ocr(gray)
+self._ocr_cache[key] = words
+if len(self._ocr_cache) > 64:
+self._ocr_cache.pop(next(iter(self._ocr_cache)))
+heights = sorted(word['height'] for word in words)
+if heights:
+self._ocr_text_heights[purpose] = heights[len(heights) // 2] / scale
+else:
+self.logger.debug(f"Using cached OCR result for {purpose} region")
+return [
+{
+'text': word['text'],
+'left': offset[0] + int(word['left'] / scale),
+'top': offset[1] + int(word['top'] / scale),
+'width': int(word['width'] / scale),
+'height': int(word['height'] / scale)
+}
+for word in words
+]
 def _find_file_using_ocr(self, file_name):
 """Use OCR to find file name text"""
 try:
-import pytesseract
-from PIL import Image
-# Take screenshot
-screenshot = pyautogui.screenshot()
-# Get OCR data with bounding boxes
-ocr_data = pytesseract.image_to_data(screenshot, output_type=pytesseract.Output.DICT)
+# Take screenshot of the file manager window when its bounds are known
+screenshot, (offset_x, offset_y) = self._capture_screen(self._active_window_region())
+# Get OCR words with screen bounding boxes
+words = self._ocr_words(screenshot, (offset_x, offset_y), 'file_name')
 # Look for filename matches
 file_base = Path(file_name).stem
-for i, text in enumerate(ocr_data['text']):
-if not text.strip():
-continue
+for word in words:
+text = word['text']
 text_clean = text.strip().lower()
 # Check if this text matches our file
 if (file_base.lower() in text_clean or
 text_clean in file_base.lower() or
 any(part in text_clean for part in file_base.split() if len(part) > 3)):
 # Get text position
-x = ocr_data['left'][i] + ocr_data['width'][i] // 2
-y = ocr_data['top'][i]
+x, y = self._to_screen_point(word['left'] + word['width'] // 2, word['top'])
 # Adjust to click on icon above text (typical macOS/Windows layout)
 icon_y = max(50, y - 30)
 self.logger.info(f"OCR found '{text}' matching '{file_name}' at: ({x}, {icon_y})")
 return (x, icon_y)
 except ImportError:
-self.logger.debug("pytesseract not available for OCR")
+self.logger.debug("No OCR engine (tesserocr or pytesseract) available")
 except Exception as e:
 self.logger.debug(f"OCR detection failed: {str(e)}")
 return None
@@ -870,75 +1690,28 @@ def _click_upload_button_with_computer_vision(self):
 """Use advanced computer vision to find and click upload button"""
 try:
 self.logger.info("🖱️ Using enhanced computer vision to detect upload button...")
-# Take a screenshot
-screenshot = pyautogui.screenshot()
-screenshot_np = np.array(screenshot)
-# Convert to grayscale
-screenshot_gray = np.dot(screenshot_np[...,:3], [0.2989, 0.5870, 0.1140])
+# Capture the upload dialog, or the browser window if the dialog isn't open
+region = self._browser_screen_region("#ui-id-4") or self._browser_screen_region()
+screenshot, screenshot_gray, (offset_x, offset_y) = self._grab_gray_frame(region)
 # Load the upload button template image
 template_path = 'upload_button.png'
 if not Path(template_path).exists():
 self.logger.error(f"Upload button template not found: {template_path}")
 return False
-try:
-template_pil = Image.open(template_path)
-template_np = np.array(template_pil)
-if len(template_np.shape) == 3:
-template_gray = np.dot(template_np[...,:3], [0.2989, 0.5870, 0.1140])
-else:
-template_gray = template_np
-except Exception as e:
-self.logger.error(f"Could not load upload button template: {template_path}, error: {e}")
-return False
-self.logger.info(f"📋 Template loaded ({template_gray.shape}), using multi-scale matching...")
 # Try multiple scales for template matching
 scales = [1.0, 0.9, 1.1, 0.8, 1.2, 0.7, 1.3, 0.6, 1.4]
-best_match = None
-best_confidence = 0
-for scale in scales:
 try:
-# Resize template
-if scale != 1.0:
-new_height = int(template_gray.shape[0] * scale)
-new_width = int(template_gray.shape[1] * scale)
-if new_width <= 0 or new_height <= 0:
-continue
-scaled_template = transform.resize(
-template_gray,
-(new_height, new_width),
-anti_aliasing=True,
-preserve_range=True
-).astype(template_gray.dtype)
-else:
-scaled_template = template_gray
-# Skip if template is larger than screenshot
-if (scaled_template.shape[0] > screenshot_gray.shape[0] or
-scaled_template.shape[1] > screenshot_gray.shape[1]):
-continue
-# Perform template matching
-result = feature.match_template(screenshot_gray, scaled_template)
-# Find best match
-max_loc = np.unravel_index(np.argmax(result), result.shape)
-confidence = result[max_loc]
-if confidence > best_confidence:
-best_confidence = confidence
-h, w = scaled_template.shape[:2]
-best_match = {
-'confidence': confidence,
-'location': (max_loc[1], max_loc[0]), # Convert (y,x) to (x,y)
-'size': (w, h),
-'scale': scale
-}
-self.logger.debug(f"Scale {scale}: confidence {confidence:.3f}")
+template = self._get_template(template_path, scales)
 except Exception as e:
-self.logger.debug(f"Error with scale {scale}: {str(e)}")
-continue
-# Check if we found a good match
+self.logger.error(f"Could not load upload button template: {template_path}, error: {e}")
+return False
+self.logger.info(f"📋 Using multi-scale matching with template {template['gray'].shape}...")
 confidence_threshold = 0.5 # Lower threshold for better detection
+best_match = self._match_template(screenshot_gray, template, scales, confidence_threshold, hint_key=template_path, offset=(offset_x, offset_y))
+# Check if we found a good match
 if best_match and best_match['confidence'] > confidence_threshold:
 # Calculate center of the button
-center_x = best_match['location'][0] + best_match['size'][0] // 2
-center_y = best_match['location'][1] + best_match['size'][1] // 2
+center_x, center_y = self._to_screen_point(offset_x + best_match['location'][0] + best_match['size'][0] // 2, offset_y + best_match['location'][1] + best_match['size'][1] // 2)
 self.logger.info(f"✅ Upload button found at ({center_x}, {center_y}) with confidence {best_match['confidence']:.3f} (scale: {best_match['scale']})")
 # Drag mouse to button and tap once
 self.logger.info("🖱️ Moving mouse to upload button...")
@@ -949,7 +1722,7 @@ self.logger.info("✅ Upload button tapped")
 return True
 # If template matching fails, try OCR-based detection
 self.logger.warning("Template matching failed, trying OCR detection...")
-ocr_result = self._find_upload_button_using_ocr(screenshot)
+ocr_result = self._find_upload_button_using_ocr(screenshot, (offset_x, offset_y))
 if ocr_result:
 center_x, center_y = ocr_result
 self.logger.info(f"✅ Upload button found via OCR at ({center_x}, {center_y})")
@@ -973,30 +1746,24 @@ return False
 except Exception as e:
 self.logger.error(f"Enhanced computer vision upload button detection failed: {str(e)}")
 return False
-def _find_upload_button_using_ocr(self, screenshot):
-"""Use OCR to find upload button text"""
+def _find_upload_button_using_ocr(self, screenshot, offset=(0, 0)):
+"""Use OCR to find upload button text in a screenshot captured at offset"""
 try:
-import pytesseract
-from PIL import Image
-# Convert screenshot to PIL Image
-screenshot_pil = Image.fromarray(np.array(screenshot))
-# Get OCR data with bounding boxes
-ocr_data = pytesseract.image_to_data(screenshot_pil, output_type=pytesseract.Output.DICT)
+# Get OCR words with screen bounding boxes
+words = self._ocr_words(screenshot, offset, 'upload_button')
 # Look for upload-related text
 upload_keywords = ['upload', 'file', 'submit', 'save', 'attach']
-for i, text in enumerate(ocr_data['text']):
-if not text.strip():
-continue
+for word in words:
+text = word['text']
 text_clean = text.strip().lower()
 # Check if this text matches upload keywords
 if any(keyword in text_clean for keyword in upload_keywords):
 # Get text position
-x = ocr_data['left'][i] + ocr_data['width'][i] // 2
-y = ocr_data['top'][i] + ocr_data['height'][i] // 2
+x, y = self._to_screen_point(word['left'] + word['width'] // 2, word['top'] + word['height'] // 2)
 self.logger.info(f"OCR found '{text}' at: ({x}, {y})")
 return (x, y)
 except ImportError:
-self.logger.debug("pytesseract not available for OCR")
+self.logger.debug("No OCR engine (tesserocr or pytesseract) available")
 except Exception as e:
 self.logger.debug(f"OCR detection failed: {str(e)}")
 return None
@@ -1102,12 +1869,35 @@ pyautogui.mouseUp(button='left')
 except:
 pass
 return False
-def _handle_popup_form(self):
-"""Handle the popup form that appears after drag and drop"""
+def _upload_via_file_input(self, file_path):
+"""Send the file's absolute path to the chart's file input, which also works headless"""
+try:
+file_input = self._wait_until(lambda driver: driver.execute_script(self._FILE_INPUT_SCRIPT), 'element')
+if not file_input:
+self.logger.warning("⚠️ No file input found on the chart page")
+return False
+file_input.send_keys(str(Path(file_path).resolve()))
+self.logger.info(f"Sent {Path(file_path).name} to the chart's file input")
+return True
+except Exception as e:
+self.logger.warning(f"⚠️ File input upload failed: {str(e)}")
+return False
+def _get_document_type(self):
+"""Run the document type detector once for the current upload"""
+try:
+document_type = get_document_type()
+self.logger.info(f"Document type: {document_type}")
+return document_type or ''
+except Exception as e:
+self.logger.error(f"Document type not found: {str(e)}")
+return ''
+def _handle_popup_form(self, document_id=None, title=None):
+"""Handle the popup form that appears after a file upload, using title for the Title field"""
+uploaded_title = None
 try:
 self.logger.info("Handling popup form after file upload...")
 # Wait for popup to fully load
-time.sleep(3) # Match previous method's timing
+self._wait_for_dialog_open()
 # Fill Provider field using the specific selector from previous method
 if self.attributed_to_name:
 try:
@@ -1120,7 +1910,6 @@ provider_field.clear()
 provider_field.send_keys(self.attributed_to_name)
 self.logger.info(f"Typed Provider name: {self.attributed_to_name}")
 # Wait for autocomplete dropdown
-time.sleep(1)
 try:
 first_suggestion = WebDriverWait(self.driver, 3).until(
 EC.element_to_be_clickable((By.CSS_SELECTOR, "[id^='physicianUserName-popover-'] > div > div.mr-results > div:first-child > div"))
@@ -1139,7 +1928,6 @@ provider_field.send_keys(Keys.ENTER)
 self.logger.info("Selected first option using keyboard navigation")
 except Exception as ke:
 self.logger.error(f"Keyboard navigation failed: {str(ke)}")
-time.sleep(0.5)
 except Exception as e:
 self.logger.error(f"Failed to fill Provider field: {str(e)}")
 # Select "Home Health Report" in Doc Type dropdown (using new method's logic)
@@ -1156,18 +1944,19 @@ doc_type_selectors = [
 "#ui-id-4 select"
 ]
 doc_type_dropdown = None
-for selector in doc_type_selectors:
+for selector in self._rank_selectors('doc_type', [(By.CSS_SELECTOR, selector) for selector in doc_type_selectors]):
+selector_start = time.time()
 try:
-doc_type_dropdown = popup_container.find_element(By.CSS_SELECTOR, selector)
+doc_type_dropdown = popup_container.find_element(*selector)
+self._record_selector_result('doc_type', selector, True, time.time() - selector_start)
 break
 except:
+self._record_selector_result('doc_type', selector, False)
 continue
 if doc_type_dropdown:
 self.driver.execute_script("arguments[0].scrollIntoView(true);", doc_type_dropdown)
-time.sleep(0.5)
 doc_type_dropdown.click()
 self.logger.info("Opened Doc Type dropdown")
-time.sleep(0.5)
 select = Select(doc_type_dropdown)
 try:
 select.select_by_visible_text("Home Health Report")
@@ -1180,7 +1969,6 @@ self.logger.info(f"Successfully selected '{option.text}' in Doc Type dropdown")
 break
 else:
 self.logger.warning("Could not select 'Home Health Report' in dropdown")
-time.sleep(0.5)
 else:
 self.logger.error("Doc Type dropdown not found in popup")
 except Exception as e:
@@ -1188,22 +1976,15 @@ self.logger.error(f"Error handling Doc Type dropdown: {str(e)}")
 # Fill Title field with document type using previous method's selector
 try:
 self.logger.info("📝 Filling Title field with document type...")
-try:
-from document_type_detector import main as get_document_type
-document_info = get_document_type()
-self.logger.info(f"Document type: {document_info}")
-except Exception as e:
-document_info = ''
-self.logger.error(f"Document type not found: {str(e)}")
+document_info = title
 title_textarea = WebDriverWait(self.driver, 10).until(
 EC.presence_of_element_located((By.CSS_SELECTOR, "#ui-id-4 > div.dialog-content > div > form > div:nth-child(6) > div > div > textarea.w100.ebs-form-control.info-field.el8InfoText"))
 )
 self.driver.execute_script("arguments[0].scrollIntoView(true);", title_textarea)
-time.sleep(0.5)
 title_textarea.clear()
 title_textarea.send_keys(document_info or "Home Health Report")
+uploaded_title = document_info or "Home Health Report"
 self.logger.info(f"Successfully filled Title field with: {document_info or 'Home Health Report'}")
-time.sleep(0.5)
 except Exception as e:
 self.logger.error(f"Failed to fill Title field: {str(e)}")
 # Check "Mark on behalf of reviewer" checkbox using previous method's selector
@@ -1215,7 +1996,6 @@ EC.element_to_be_clickable((By.CSS_SELECTOR, "#ui-id-4 > div.dialog-content > di
 label_text = reviewer_label.text.lower()
 if "reviewer" in label_text or "behalf of reviewer" in label_text:
 self.driver.execute_script("arguments[0].scrollIntoView(true);", reviewer_label)
-time.sleep(0.5)
 reviewer_label.click()
 self.logger.info("Successfully checked 'Mark on behalf of reviewer' checkbox")
 try:
@@ -1227,7 +2007,6 @@ self.logger.warning("⚠️ Reviewer checkbox not checked, retrying...")
 reviewer_checkbox_input.click()
 except:
 self.logger.info("Could not verify checkbox state")
-time.sleep(0.5)
 else:
 self.logger.warning(f"Found element but text doesn't match reviewer checkbox: '{label_text}'")
 raise Exception("Element found but text doesn't match 'reviewer' checkbox")
@@ -1249,43 +2028,39 @@ upload_button = WebDriverWait(self.driver, 10).until(
 EC.element_to_be_clickable((By.CSS_SELECTOR, "#ui-id-4 > div.ui-dialog-buttonpane.ui-widget-content.ui-helper-clearfix > div > ul > li:nth-child(1) > button"))
 )
 self.driver.execute_script("arguments[0].scrollIntoView(true);", upload_button)
-time.sleep(0.5)
+self._watch_chart_feed()
 upload_button.click()
 self.logger.info("Successfully clicked Upload button")
-time.sleep(4) # Wait for upload to process
+self._journal_stage(document_id, 'uploaded')
+# Wait for upload to process
+self._wait_for_dialog_close()
+self._wait_for_network_idle()
 except Exception as e:
 self.logger.error(f"Failed to click Upload button: {str(e)}")
 return False
+# Confirm the new record in place first and only reload the chart if it doesn't appear
+feed_entries = self._wait_for_new_chart_feed_entry(title=uploaded_title, document_id=document_id)
+if feed_entries:
+found_home_health = True
+entry = feed_entries[0]
+self.logger.info(f"Upload confirmed in chart feed without refresh: {entry['date']} | {entry['type']} | {entry['title']}")
+else:
 # Refresh page and check chronological records using previous method's selector
 self.logger.info("🔄 Refreshing page to check chronological records...")
 self.driver.refresh()
-time.sleep(5) # Match previous method's timing
+self._wait_for_page_ready()
 try:
-chart_feed_list = WebDriverWait(self.driver, 15).until(
+WebDriverWait(self.driver, 15).until(
 EC.presence_of_element_located((By.CSS_SELECTOR, "#chart-feed-list"))
 )
-self.logger.info("Chart feed list found, checking for Home Health record...")
-found_home_health = False
-try:
-chart_feed_text = chart_feed_list.text.lower()
-if "home health" in chart_feed_text:
-found_home_health = True
-self.logger.info("Found Home Health record in chronological records!")
+self.logger.info("Chart feed list found, checking for uploaded record...")
+feed_entries = self._find_chart_feed_entries(title=uploaded_title, document_id=document_id)
+found_home_health = bool(feed_entries)
+if found_home_health:
+entry = feed_entries[0]
+self.logger.info(f"Found uploaded record in chronological records: {entry['date']} | {entry['type']} | {entry['title']} (matched {', '.join(entry['matched'])})")
 else:
-feed_elements = chart_feed_list.find_elements(By.CSS_SELECTOR, "*")
-for element in feed_elements:
-try:
-element_text = element.text.lower()
-if "home health" in element_text:
-found_home_health = True
-self.logger.info("Found Home Health record in chronological records!")
-break
-except:
-continue
-if not found_home_health:
-self.logger.warning(f"Home Health record not found in chronological records. Preview: {chart_feed_list.text[:200]}...")
-except Exception as e:
-self.logger.warning(f"Error checking chart feed text: {str(e)}")
+self.logger.warning(f"Uploaded record not found in chronological records. Preview: {self._chart_feed_preview}...")
 except Exception as e:
 self.logger.error(f"Chart feed list not found: {str(e)}")
 found_home_health = False
@@ -1297,6 +2072,36 @@ except Exception as e:
 self.logger.error(f"Error handling popup form: {str(e)}")
 self._switch_to_main_tab() # Attempt to switch back even on error
 return False
+def _find_chart_feed_entries(self, title=None, document_id=None, only_new=False):
+"""Search the chart feed in one script call for an exact title or Document Id and return matching entries"""
+# Title must equal the entry's title and the Document Id must be an exact id or whole token;
+# without either, the generic record type is matched instead
+title = ' '.join(str(title or '').split()).lower()
+document_id = str(document_id or '').strip().lower()
+result = self.driver.execute_script(self._CHART_FEED_SCRIPT, "#chart-feed-list", title, document_id, only_new)
+if not result:
+self._chart_feed_preview = ''
+return []
+self._chart_feed_preview = result['preview']
+return result['entries']
+def _watch_chart_feed(self):
+"""Start marking chart feed nodes added from now on so a new record can be confirmed in place"""
+try:
+return self.driver.execute_script(self._CHART_FEED_WATCH_SCRIPT, "#chart-feed-list")
+except Exception as e:
+self.logger.debug(f"Could not watch chart feed: {str(e)}")
+return False
+def _wait_for_new_chart_feed_entry(self, title=None, document_id=None, ceiling='upload_confirm'):
+"""Wait for a matching record to be added to the chart feed without reloading the page"""
+try:
+return self._wait_until(
+lambda driver: self._find_chart_feed_entries(title=title, document_id=document_id, only_new=True),
+ceiling,
+poll_frequency=0.25
+) or []
+except Exception as e:
+self.logger.debug(f"In-place upload confirmation failed: {str(e)}")
+return []
 def _cleanup_temporary_file(self, temp_file_path):
 """Clean up temporary file after successful upload verification"""
 try:
@@ -1305,14 +2110,123 @@ Path(temp_file_path).unlink()
 self.logger.info(f"✅ Cleaned up temporary file: {temp_file_path}")
 except Exception as e:
 self.logger.warning(f"Failed to clean up temporary file {temp_file_path}: {str(e)}")
-def _log_upload_to_csv(self, file_path, physician_name, document_type, title_field, remarks):
-log_file = 'uploads_log.csv'
-file_exists = Path(log_file).exists()
-with open(log_file, mode='a', newline='', encoding='utf-8') as csvfile:
-writer = csv.writer(csvfile)
-if not file_exists:
-writer.writerow(['File', 'Physician', 'Document Type', 'Title', 'Remarks'])
-writer.writerow([file_path, physician_name, document_type, title_field, remarks])
+def _upload_log_file(self):
+"""Return the upload log path, defaulting to uploads_log with the backend's suffix"""
+return Path(self.upload_log_path or f"uploads_log{self._UPLOAD_LOG_SUFFIXES[self.upload_log_backend]}")
+def _open_upload_log(self):
+"""Open the upload log backend once and index the Document Ids it already has as uploaded"""
+if self._upload_log is not None:
+return self._upload_log
+log_file = self._upload_log_file()
+if self.upload_log_backend == 'sqlite':
+connection = sqlite3.connect(str(log_file), timeout=30, check_same_thread=False)
+connection.execute("PRAGMA journal_mode=WAL")
+connection.execute("PRAGMA synchronous=NORMAL")
+connection.execute(
+"CREATE TABLE IF NOT EXISTS uploads (id INTEGER PRIMARY KEY, "
++ ", ".join(f"{key} {'REAL' if key == 'duration' else 'TEXT'}" for key, _ in self._UPLOAD_LOG_COLUMNS) + ")"
+)
+connection.execute("CREATE INDEX IF NOT EXISTS idx_uploads_document_id ON uploads (document_id)")
+connection.execute("CREATE INDEX IF NOT EXISTS idx_uploads_status ON uploads (status)")
+connection.commit()
+self._upload_log = connection
+return connection
+if self.upload_log_backend == 'csv' and log_file.exists():
+with open(log_file, mode='r', newline='', encoding='utf-8') as csvfile:
+header = next(csv.reader(csvfile), None)
+if header != [label for _, label in self._UPLOAD_LOG_COLUMNS]:
+# Keep logs written with the old columns instead of appending mismatched rows
+legacy_file = log_file.with_name(f"{log_file.stem}.legacy-{int(time.time())}{log_file.suffix}")
+log_file.replace(legacy_file)
+self.logger.info(f"Moved upload log with old columns to {legacy_file}")
+self._uploaded_document_ids = {
+record['document_id'] for record in self._read_upload_log(log_file) if record.get('status') == 'success'
+}
+file_exists = log_file.exists()
+self._upload_log = open(log_file, mode='a', newline='', encoding='utf-8')
+if self.upload_log_backend == 'csv' and not file_exists:
+csv.writer(self._upload_log).writerow([label for _, label in self._UPLOAD_LOG_COLUMNS])
+return self._upload_log
+def _read_upload_log(self, log_file):
+"""Yield records from a CSV or JSONL upload log"""
+if not Path(log_file).exists():
+return
+with open(log_file, mode='r', newline='', encoding='utf-8') as f:
+if self.upload_log_backend == 'jsonl':
+for line in f:
+try:
+yield json.loads(line)
+except ValueError:
+continue
+else:
+labels = {label: key for key, label in self._UPLOAD_LOG_COLUMNS}
+for row in csv.DictReader(f):
+yield {labels.get(label, label): value for label, value in row.items()}
+def _log_upload(self, file_path, physician_name, document_type, title_field, remarks, status, started_at=None, patient=None):
+"""Record an upload attempt with its patient, Document Id, status and duration"""
+# Pipelined runs search the next patient before this upload, so batch callers pass the patient in
+patient = patient or self.current_patient or {}
+record = {
+'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+'document_id': Path(file_path).stem,
+'patient': patient.get('name') or '',
+'dob': patient.get('dob') or '',
+'file': str(file_path),
+'physician': physician_name,
+'document_type': document_type,
+'title': title_field,
+'status': status,
+'remarks': remarks,
+'duration': round(time.perf_counter() - started_at, 3) if started_at else None
+}
+try:
+upload_log = self._open_upload_log()
+if self.upload_log_backend == 'sqlite':
+keys = [key for key, _ in self._UPLOAD_LOG_COLUMNS]
+upload_log.execute(
+f"INSERT INTO uploads ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))})",
+[record[key] for key in keys]
+)
+upload_log.commit()
+return
+self._upload_log_buffer.append(record)
+if status == 'success':
+self._uploaded_document_ids.add(record['document_id'])
+if len(self._upload_log_buffer) >= self.upload_log_flush_rows:
+self._flush_upload_log()
+except Exception as e:
+self.logger.warning(f"⚠️ Could not write upload log record: {str(e)}")
+def _flush_upload_log(self):
+"""Write buffered upload records to the CSV or JSONL log"""
+if not self._upload_log_buffer or self._upload_log is None:
+return
+if self.upload_log_backend == 'jsonl':
+self._upload_log.writelines(json.dumps(record) + '\n' for record in self._upload_log_buffer)
+else:
+csv.writer(self._upload_log).writerows(
+[record.get(key) for key, _ in self._UPLOAD_LOG_COLUMNS] for record in self._upload_log_buffer
+)
+self._upload_log.flush()
+self._upload_log_buffer = []
+def _close_upload_log(self):
+"""Flush and close the upload log"""
+if self._upload_log is None:
+return
+try:
+self._flush_upload_log()
+self._upload_log.close()
+except Exception as e:
+self.logger.warning(f"⚠️ Could not close upload log: {str(e)}")
+self._upload_log = None
+def is_already_uploaded(self, document_id):
+"""Check the upload log for a successful upload of a Document Id"""
+upload_log = self._open_upload_log()
+if self.upload_log_backend == 'sqlite':
+row = upload_log.execute(
+"SELECT 1 FROM uploads WHERE document_id = ? AND status = 'success' LIMIT 1", (str(document_id),)
+).fetchone()
+return row is not None
+return str(document_id) in self._uploaded_document_ids
 # def upload_file(self, file_path):
 # """Upload file using drag and drop and handle popup"""
 # temp_file_path = None
@@ -1363,20 +2277,28 @@ writer.writerow([file_path, physician_name, document_type, title_field, remarks]
 # self._cleanup_temporary_file(temp_file_path)
 # return False
 # Replace the existing upload_file method with this method
-def upload_file(self, file_path, is_batch=False):
-"""Upload file using manual upload with delay and handle popup"""
+def upload_file(self, file_path, is_batch=False, patient=None):
+"""Upload file through the chart's file input (or a manual upload pause) and handle popup"""
 temp_file_path = None
 document_info = None
 remarks = ''
+started_at = time.perf_counter()
 try:
 if not Path(file_path).exists():
 remarks = f"File not found: {file_path}"
-self._log_upload_to_csv(file_path, self.attributed_to_name or '', 'Home Health Report', '', remarks)
+self._log_upload(file_path, self.attributed_to_name or '', 'Home Health Report', '', remarks, 'error', started_at, patient)
 raise ValueError(remarks)
 self.logger.info(f"Uploading: {Path(file_path).name}")
-if len(self.driver.window_handles) > 1:
+if self.chart_window_handle:
+# Pipelined runs may have the next patient's chart open in a later tab
+self.driver.switch_to.window(self.chart_window_handle)
+elif len(self.driver.window_handles) > 1:
 self.driver.switch_to.window(self.driver.window_handles[-1])
-time.sleep(3)
+self._wait_for_page_ready()
+uploaded = self.upload_mode == 'input' and self._upload_via_file_input(file_path)
+if not uploaded:
+if self.upload_mode == 'input':
+self.logger.info("Falling back to manual upload")
 # Manual upload prompt
 print("\n" + "="*60)
 print("📤 Manual File Upload Required")
@@ -1392,32 +2314,26 @@ self.logger.info(f"Pausing for {30 if not is_batch else 45} seconds to allow man
 time.sleep(30 if not is_batch else 45) # Longer delay in batch mode
 self.logger.info("Resuming after manual upload delay")
 print("✅ Resuming automation after manual upload...")
-# Try to get document info for logging
-try:
-from document_type_detector import main as get_document_type
-document_info = get_document_type()
-time.sleep(3) # Brief pause after getting document info
-except Exception as e:
-document_info = ''
+# Document type is used for the Title field and the upload log
+document_info = self._get_document_type()
 # Handle the popup form that appears after upload
-self.logger.info("Handling popup form after manual file upload...")
-time.sleep(5) # Wait for popup to appear
-verification_result = self._handle_popup_form()
-time.sleep(2) # Wait for popup processing to complete
+self.logger.info("Handling popup form after file upload...")
+self._wait_for_dialog_open() # Wait for popup to appear
+verification_result = self._handle_popup_form(document_id=Path(file_path).stem, title=document_info)
 if verification_result:
 remarks = 'success'
-self._log_upload_to_csv(file_path, self.attributed_to_name or '', 'Home Health Report', document_info or '', remarks)
+self._log_upload(file_path, self.attributed_to_name or '', 'Home Health Report', document_info or '', remarks, 'success', started_at, patient)
 self._cleanup_temporary_file(temp_file_path) # No temp file, but keep for compatibility
 return True
 else:
 remarks = 'chronological record not found after upload'
-self._log_upload_to_csv(file_path, self.attributed_to_name or '', 'Home Health Report', document_info or '', remarks)
+self._log_upload(file_path, self.attributed_to_name or '', 'Home Health Report', document_info or '', remarks, 'failed', started_at, patient)
 self.logger.warning("⚠️ Upload completed but verification failed - Home Health record not found")
 self.logger.info("📁 No temporary file created for manual upload")
 return False
 except Exception as e:
 remarks = f"Upload error: {str(e)}"
-self._log_upload_to_csv(file_path, self.attributed_to_name or '', 'Home Health Report', document_info or '', remarks)
+self._log_upload(file_path, self.attributed_to_name or '', 'Home Health Report', document_info or '', remarks, 'error', started_at, patient)
 self.logger.error(f"Upload error: {str(e)}")
 return False
 # Add this method to ElationBot class
@@ -1429,7 +2345,7 @@ homepage_link = WebDriverWait(self.driver, 10).until(
 EC.element_to_be_clickable((By.CSS_SELECTOR, "#queuenav > a > div > span"))
 )
 homepage_link.click()
-time.sleep(3) # Wait for homepage to load
+self._wait_for_page_ready() # Wait for homepage to load
 search_box = self._find_search_bar(timeout=5)
 if search_box:
 self.logger.info("✅ Browser state reset: homepage loaded, search bar found")
@@ -1448,8 +2364,9 @@ self.logger.info("🔄 Closing current tab and switching to main tab...")
 if len(self.driver.window_handles) > 1:
 current_handle = self.driver.current_window_handle
 self.driver.close() # Close the patient chart tab
+self.chart_window_handle = None
 self.driver.switch_to.window(self.driver.window_handles[0]) # Switch to main tab
-time.sleep(1) # Wait for tab switch to stabilize
+self._wait_for_page_ready() # Wait for tab switch to stabilize
 # Verify search bar is present
 search_box = self._find_search_bar(timeout=5)
 if search_box:
@@ -1505,7 +2422,10 @@ if not self.search_patient(patient_name=patient_name, patient_dob=patient_dob):
 return False
 # Upload file
 self.logger.info(f"Uploading: {Path(file_path).name}")
-if not self.upload_file(file_path, is_batch=(not keep_open)):
+uploaded = self.upload_file(file_path, is_batch=(not keep_open))
+# Write the audit row now, since keep_open runs may never reach close()
+self._flush_upload_log()
+if not uploaded:
 return False
 # Handle keep_open parameter - only close on success if keep_open
 if not keep_open:
@@ -1515,39 +2435,138 @@ return True
 except Exception as e:
 self.logger.error(f"Workflow failed: {str(e)}")
 return False
-def run_batch_workflow(self, file_paths=None, username=None, password=None, url=None, keep_open=False, max_patients=2):
+def _open_batch_journal(self):
+"""Open the batch journal for appending"""
+self._close_batch_journal()
+self._batch_journal = open(self.batch_journal_path, 'a', encoding='utf-8')
+def _close_batch_journal(self):
+"""Close the batch journal if it is open"""
+if self._batch_journal:
+self._batch_journal.close()
+self._batch_journal = None
+def _journal_stage(self, document_id, stage):
+"""Append a patient stage to the batch journal and fsync it before continuing"""
+if not self._batch_journal or not document_id:
+return
+try:
+entry = {'document_id': str(document_id), 'stage': stage, 'time': time.time()}
+self._batch_journal.write(json.dumps(entry) + '\n')
+self._batch_journal.flush()
+os.fsync(self._batch_journal.fileno())
+except Exception as e:
+self.logger.warning(f"⚠️ Could not write batch journal entry: {str(e)}")
+def _load_batch_journal(self):
+"""Replay the batch journal into the furthest stage reached per Document Id"""
+progress = {}
+if not Path(self.batch_journal_path).exists():
+return progress
+with open(self.batch_journal_path, 'r', encoding='utf-8') as f:
+for line in f:
+try:
+entry = json.loads(line)
+except ValueError:
+# A crash can leave a partial last line behind
+continue
+stage = entry.get('stage')
+if stage not in self._JOURNAL_STAGES:
+continue
+previous = progress.get(entry.get('document_id'))
+if previous and self._JOURNAL_STAGES.index(previous['stage']) > self._JOURNAL_STAGES.index(stage):
+continue
+progress[entry.get('document_id')] = entry
+self.logger.info(f"📒 Loaded batch journal with {len(progress)} documents")
+return progress
+def _is_document_done(self, document_id, verified_ids):
+"""Whether a resumed batch can skip a document (verified in the journal or logged as uploaded)"""
+return document_id in verified_ids or self.is_already_uploaded(document_id)
+def _confirm_journaled_upload(self, patient):
+"""Check the open chart for an upload that was clicked but never verified, by Document Id only"""
+if not patient['document_id']:
+return False
+try:
+WebDriverWait(self.driver, self.wait_timeouts['page_ready']).until(
+EC.presence_of_element_located((By.CSS_SELECTOR, "#chart-feed-list"))
+)
+# A title match could be any earlier record of the same type, so anything short of
+# a Document Id match is treated as not uploaded and the file is uploaded again
+feed_entries = self._find_chart_feed_entries(document_id=patient['document_id'])
+if feed_entries:
+entry = feed_entries[0]
+self.logger.info(f"Found earlier upload in chart feed: {entry['date']} | {entry['type']} | {entry['title']}")
+return True
+self.logger.info("Earlier upload not found in chart feed, uploading again")
+return False
+except Exception as e:
+self.logger.warning(f"⚠️ Could not re-check earlier upload: {str(e)}")
+return False
+def run_batch_workflow(self, file_paths=None, username=None, password=None, url=None, keep_open=False, max_patients=2, stream=False, resume=False):
 """Run batch workflow for multiple patients and files from Excel, using correct PDF path"""
 try:
 self.logger.info("🚀 Starting batch workflow...")
+# In resume mode verified documents are dropped before the patient limit is applied
+journal = self._load_batch_journal() if resume else {}
+verified_ids = {document_id for document_id, entry in journal.items() if entry['stage'] == 'verified'}
+source_limit = None if resume else max_patients
 # Read patients from Excel with limit
 self.logger.info(f"📊 Reading patients from Excel (max {max_patients})...")
-patients = self.read_all_patients_from_excel(max_patients=max_patients)
+if stream:
+# Patients are parsed lazily so the first one starts before the workbook is fully read
+patients = self.iter_patients_from_excel(max_patients=source_limit)
+if resume:
+patients = (patient for patient in patients if not self._is_document_done(patient['document_id'], verified_ids))
+patients = itertools.islice(patients, max_patients)
+total_patients = max_patients or '?'
+self.logger.info(f"📋 Streaming patients from Excel (max limit: {max_patients})")
+else:
+patients = self.read_all_patients_from_excel(max_patients=source_limit)
+if resume:
+patients = [patient for patient in patients if not self._is_document_done(patient['document_id'], verified_ids)][:max_patients]
+if not patients:
+self.logger.info("✅ All patients are already verified or logged as uploaded")
+return True
 if not patients:
 raise ValueError("No patients found in Excel file")
-# Use the correct PDF path for each patient
-files_to_process = [p['pdf_path'] for p in patients]
 # Validate that we have files for all patients
-for file_path in files_to_process:
-if not Path(file_path).exists():
-self.logger.error(f"File not found: {file_path}")
+for patient in patients:
+if not Path(patient['pdf_path']).exists():
+self.logger.error(f"File not found: {patient['pdf_path']}")
 return False
-self.logger.info(f"📋 Processing {len(patients)} patients with {len(files_to_process)} files (max limit: {max_patients})")
+total_patients = len(patients)
+self.logger.info(f"📋 Processing {len(patients)} patients with {len(patients)} files (max limit: {max_patients})")
+if verified_ids:
+self.logger.info(f"⏭️ Resuming: skipping {len(verified_ids)} verified documents from the batch journal")
+self._open_batch_journal()
 successful_uploads = 0
 failed_uploads = 0
-for i, (patient, file_path) in enumerate(zip(patients, files_to_process)):
+for i, patient in enumerate(patients):
 try:
+# Use the correct PDF path for each patient
+file_path = patient['pdf_path']
 self.logger.info(f"\n{'='*60}")
-self.logger.info(f"📋 PROCESSING PATIENT {i+1}/{len(patients)}")
+self.logger.info(f"📋 PROCESSING PATIENT {i+1}/{total_patients}")
 self.logger.info(f"👤 Patient: {patient['name']}")
 self.logger.info(f"📅 DOB: {patient['dob'] or 'Not provided'}")
 self.logger.info(f"📁 File: {Path(file_path).name}")
 self.logger.info(f"{'='*60}")
+if stream and not Path(file_path).exists():
+self.logger.error(f"File not found: {file_path}")
+failed_uploads += 1
+continue
 if not self.search_patient(patient_name=patient['name'], patient_dob=patient['dob']):
 self.logger.error(f"❌ Failed to find patient: {patient['name']}")
 failed_uploads += 1
 continue
+self._journal_stage(patient['document_id'], 'searched')
+journal_entry = journal.get(patient['document_id'])
+if journal_entry and journal_entry['stage'] == 'uploaded' and self._confirm_journaled_upload(patient):
+self._journal_stage(patient['document_id'], 'verified')
+self.logger.info(f"✅ Earlier upload verified for {patient['name']}")
+successful_uploads += 1
+self._switch_to_main_tab()
+continue
 self.logger.info(f"📤 Uploading file: {Path(file_path).name}")
-if self.upload_file(file_path):
+if self.upload_file(file_path, patient=patient):
+self._journal_stage(patient['document_id'], 'verified')
 self.logger.info(f"✅ Successfully uploaded file for {patient['name']}")
 successful_uploads += 1
 else:
@@ -1557,14 +2576,233 @@ except Exception as patient_e:
 self.logger.error(f"❌ Error processing patient {patient['name']}: {str(patient_e)}")
 failed_uploads += 1
 continue
+if stream and successful_uploads + failed_uploads == 0:
+if resume:
+self.logger.info("✅ All patients are already verified or logged as uploaded")
+return True
+raise ValueError("No patients found in Excel file")
 return successful_uploads > 0
 except Exception as e:
 self.logger.error(f"Batch workflow failed: {str(e)}")
 if not keep_open:
 self.close()
 return False
+finally:
+self._close_batch_journal()
+self._flush_upload_log()
+def _open_patient_chart(self, patient):
+"""Search from the main tab and open the patient's chart, returning its tab and Attributed To name"""
+try:
+self.driver.switch_to.window(self.driver.window_handles[0])
+handles_before = set(self.driver.window_handles)
+self.attributed_to_name = None
+if not self.search_patient(patient_name=patient['name'], patient_dob=patient['dob']):
+self.logger.error(f"❌ Failed to find patient: {patient['name']}")
+return None
+new_handles = [handle for handle in self.driver.window_handles if handle not in handles_before]
+return {
+'handle': new_handles[0] if new_handles else None,
+'attributed_to_name': self.attributed_to_name
+}
+except Exception as e:
+self.logger.error(f"Failed to open chart for {patient['name']}: {str(e)}")
+return None
+def run_pipelined_batch_workflow(self, username=None, password=None, url=None, keep_open=False, max_patients=2):
+"""Run batch workflow keeping the next patient's chart loading in its own tab during each upload"""
+try:
+self.logger.info("🚀 Starting pipelined batch workflow...")
+patients = self.read_all_patients_from_excel(max_patients=max_patients)
+if not patients:
+raise ValueError("No patients found in Excel file")
+# Validate that we have files for all patients
+for patient in patients:
+if not Path(patient['pdf_path']).exists():
+self.logger.error(f"File not found: {patient['pdf_path']}")
+return False
+self.logger.info(f"📋 Processing {len(patients)} patients with one chart prefetched ahead")
+successful_uploads = 0
+failed_uploads = 0
+next_chart = self._open_patient_chart(patients[0])
+for i, patient in enumerate(patients):
+chart = next_chart
+next_chart = None
+prefetched = False
+try:
+self.logger.info(f"\n{'='*60}")
+self.logger.info(f"📋 PROCESSING PATIENT {i+1}/{len(patients)}")
+self.logger.info(f"👤 Patient: {patient['name']}")
+self.logger.info(f"📁 File: {Path(patient['pdf_path']).name}")
+self.logger.info(f"{'='*60}")
+if chart and chart['handle'] and i + 1 < len(patients):
+# Start loading the next chart before this patient's upload and verification
+next_chart = self._open_patient_chart(patients[i + 1])
+prefetched = True
+if not chart:
+failed_uploads += 1
+else:
+if not chart['handle']:
+self.logger.warning("Patient chart did not open in a new tab, processing without prefetch")
+self.chart_window_handle = chart['handle']
+self.attributed_to_name = chart['attributed_to_name']
+self.logger.info(f"📤 Uploading file: {Path(patient['pdf_path']).name}")
+if self.upload_file(patient['pdf_path'], patient=patient):
+self.logger.info(f"✅ Successfully uploaded file for {patient['name']}")
+successful_uploads += 1
+else:
+self.logger.error(f"❌ Failed to upload file for {patient['name']}")
+failed_uploads += 1
+except Exception as patient_e:
+self.logger.error(f"❌ Error processing patient {patient['name']}: {str(patient_e)}")
+failed_uploads += 1
+self.chart_window_handle = None
+if chart:
+# A failed upload can leave this patient's chart open; the prefetched tab stays
+self._close_chart_tab(chart['handle'])
+if not prefetched and i + 1 < len(patients):
+next_chart = self._open_patient_chart(patients[i + 1])
+self.logger.info(f"📊 Pipelined batch finished: {successful_uploads} succeeded, {failed_uploads} failed")
+return successful_uploads > 0
+except Exception as e:
+self.logger.error(f"Pipelined batch workflow failed: {str(e)}")
+if not keep_open:
+self.close()
+return False
+finally:
+self._flush_upload_log()
+def _close_chart_tab(self, handle):
+"""Close a patient chart tab if it is still open and switch back to the main tab"""
+try:
+handles = self.driver.window_handles
+if handle and handle in handles and handle != handles[0]:
+self.driver.switch_to.window(handle)
+self.driver.close()
+self.driver.switch_to.window(self.driver.window_handles[0])
+except Exception as e:
+self.logger.debug(f"Could not close chart tab: {str(e)}")
+def _merge_upload_logs(self, log_paths):
+"""Append per-session CSV or JSONL upload logs to the main log and remove them"""
+if self.upload_log_backend == 'sqlite':
+# Sessions already wrote to the shared database
+return
+self._open_upload_log()
+for log_path in log_paths:
+if Path(log_path) == self._upload_log_file() or not Path(log_path).exists():
+continue
+for record in self._read_upload_log(log_path):
+self._upload_log_buffer.append(record)
+if record.get('status') == 'success':
+self._uploaded_document_ids.add(record.get('document_id'))
+self._flush_upload_log()
+Path(log_path).unlink()
+def _is_driver_alive(self):
+"""Check whether the browser session still responds"""
+try:
+self.driver.window_handles
+return True
+except WebDriverException:
+return False
+def _run_batch_session(self, session_id, work_queue, results, results_lock):
+"""Process patients from the shared work queue on this bot's own browser session"""
+while True:
+try:
+patient = work_queue.get_nowait()
+except queue.Empty:
+return
+file_path = patient['pdf_path']
+try:
+self.logger.info(f"[Session {session_id}] 👤 Patient: {patient['name']} | 📁 File: {Path(file_path).name}")
+if not self.search_patient(patient_name=patient['name'], patient_dob=patient['dob']):
+status = 'patient not found'
+elif self.upload_file(file_path, patient=patient):
+status = 'success'
+else:
+status = 'upload failed'
+except Exception as patient_e:
+status = f"error: {str(patient_e)}"
+if status == 'success':
+self.logger.info(f"[Session {session_id}] ✅ Successfully uploaded file for {patient['name']}")
+else:
+self.logger.error(f"[Session {session_id}] ❌ {patient['name']}: {status}")
+if status != 'success' and not self._is_driver_alive():
+# A dead browser would fail every remaining patient, so hand this one back and stop
+self.logger.error(f"[Session {session_id}] ❌ Browser session lost, returning {patient['name']} to the queue")
+work_queue.put(patient)
+return
+with results_lock:
+results.append({'patient': patient, 'session': session_id, 'status': status})
+def run_parallel_batch_workflow(self, username=None, password=None, url=None, keep_open=False, max_patients=2, sessions=2, headless=True):
+"""Run the batch workflow across several independent logged-in browser sessions"""
+workers = []
+try:
+self.logger.info(f"🚀 Starting parallel batch workflow with {sessions} sessions...")
+patients = self.read_all_patients_from_excel(max_patients=max_patients)
+if not patients:
+raise ValueError("No patients found in Excel file")
+# Validate that we have files for all patients
+for patient in patients:
+if not Path(patient['pdf_path']).exists():
+self.logger.error(f"File not found: {patient['pdf_path']}")
+return False
+work_queue = queue.Queue()
+for patient in patients:
+work_queue.put(patient)
+# Log in one session at a time so any 2FA prompts don't overlap. The first session runs
+# headed so a 2FA prompt can be answered; headless sessions only reuse its saved cookies,
+# since a 2FA prompt nobody can see would block them for the full wait
+for session_id in range(1, min(sessions, len(patients)) + 1):
+restore_only = headless and session_id > 1
+worker = ElationBot(headless=restore_only)
+if not worker.initialize() or not worker.login(username, password, url, restore_only=restore_only):
+self.logger.error(f"❌ Session {session_id} could not log in, continuing without it")
+worker.close()
+continue
+# Set after initialize(), which applies config.json, so every session writes this run's log format
+worker.upload_log_backend = self.upload_log_backend
+log_file = self._upload_log_file()
+if self.upload_log_backend == 'sqlite':
+worker.upload_log_path = str(log_file)
+else:
+worker.upload_log_path = str(log_file.with_name(f"{log_file.stem}.session{session_id}{log_file.suffix}"))
+workers.append(worker)
+if not workers:
+raise ValueError("No browser session could log in")
+self.logger.info(f"📋 Processing {len(patients)} patients across {len(workers)} sessions")
+results = []
+results_lock = threading.Lock()
+threads = [
+threading.Thread(target=worker._run_batch_session, args=(session_id, work_queue, results, results_lock), daemon=True)
+for session_id, worker in enumerate(workers, 1)
+]
+for thread in threads:
+thread.start()
+for thread in threads:
+thread.join()
+for worker in workers:
+worker._close_upload_log()
+self._merge_upload_logs([worker.upload_log_path for worker in workers])
+successful_uploads = sum(1 for result in results if result['status'] == 'success')
+failures = [result for result in results if result['status'] != 'success']
+# Patients left in the queue were never attempted (e.g. every session crashed)
+while not work_queue.empty():
+failures.append({'patient': work_queue.get_nowait(), 'session': None, 'status': 'not processed'})
+self.logger.info(f"📊 Parallel batch finished: {successful_uploads} succeeded, {len(failures)} failed")
+for failure in failures:
+self.logger.error(f"❌ {failure['patient']['name']} ({failure['patient']['document_id']}): {failure['status']}")
+return successful_uploads > 0
+except Exception as e:
+self.logger.error(f"Parallel batch workflow failed: {str(e)}")
+return False
+finally:
+if not keep_open:
+for worker in workers:
+worker.close()
 def close(self):
 """Clean shutdown"""
+self._save_selector_stats()
+self._close_upload_log()
+if self._ocr_engine:
+self._ocr_engine.End()
+self._ocr_engine = None
 if self.web_driver_manager:
 self.web_driver_manager.quit()
 self.logger.info("Bot closed")
\ No newline at end of file